@@ -1,4 +1,5 @@
-from src.main import generate_city_stl_with_base
+from src.batch import map_jobs, run_batch
+import sys
 
 country_dict = {
     'brasil_country': 59470,
@@ -35,22 +36,16 @@ custom_map_dict = [
     "serrafina_custom",
 ]
 
-def process_map(maps, grid_step = 0.1, include_bottom = True):
-    for map_name in maps:
-        print("Criando o map: " + map_name)
-        if type(maps) == dict:
-            generate_city_stl_with_base(maps[map_name], map_name, grid_step, include_bottom)
-        else:
-            generate_city_stl_with_base(0, map_name, grid_step, include_bottom)
-        print("Mapa criado com sucesso!\n\n\n\n")
+def process_map(maps, grid_step = 0.1, include_bottom = True, processes = None):
+    # Os mapas são gerados em paralelo; os que usam as mesmas folhas rodam no mesmo processo
+    return run_batch(map_jobs(maps, grid_step, include_bottom), processes)
 
 
 if __name__ == '__main__':
     grid_step = 0.5
     include_bottom = True
-    process_map(country_dict, grid_step, include_bottom)
-    process_map(states_dict, grid_step, include_bottom)
-    process_map(city_dict, grid_step, include_bottom)
-    process_map(regions_dict, grid_step, include_bottom)
-    process_map(parks_dict, grid_step, include_bottom)
-    process_map(custom_map_dict, grid_step, include_bottom)
\ No newline at end of file
+    jobs = []
+    for maps in [country_dict, states_dict, city_dict, regions_dict, parks_dict, custom_map_dict]:
+        jobs += map_jobs(maps, grid_step, include_bottom)
+    # --force refaz todas as etapas, ignorando o cache
+    run_batch(jobs, force='--force' in sys.argv[1:])
@@ -0,0 +1,199 @@
+from src.mesh import TriangleMesh
+from src.surface import get_altitudes
+import numpy as np
+import shapely
+
+# Erro máximo de elevação aceito no ponto médio de cada aresta, em metros
+ADAPTIVE_TOLERANCE = 5.0
+# Níveis de subdivisão: a treliça inicial tem triângulos 2 ** ADAPTIVE_LEVELS vezes maiores que o passo final
+ADAPTIVE_LEVELS = 3
+
+
+def _edge_keys(a, b):
+    # Chave da aresta independente da ordem dos vértices (os índices cabem em 32 bits)
+    low, high = np.minimum(a, b).astype(np.int64), np.maximum(a, b).astype(np.int64)
+    return (low << 32) | high
+
+
+class _RefinementMesh:
+    """
+    Malha em refinamento: vértices com a marcação de dentro/fora e a elevação já
+    amostrada, as folhas atuais e o ponto médio de cada aresta já criado.
+    """
+    def __init__(self, polygon, mesh, estimator):
+        self.polygon = polygon
+        self.estimator = estimator
+        self.vertices = mesh.vertices[:, :2].copy()
+        self.inside = shapely.contains_xy(polygon, self.vertices[:, 0], self.vertices[:, 1])
+        self.elevations = np.full(len(self.vertices), np.nan)
+        self.faces = mesh.faces.copy()
+        # Pontos médios ordenados pela chave da aresta; split indica se a aresta já foi dividida
+        self.edge_keys = np.empty(0, dtype=np.int64)
+        self.edge_midpoints = np.empty(0, dtype=np.int32)
+        self.edge_split = np.empty(0, dtype=bool)
+
+    def _find(self, keys):
+        positions = np.minimum(np.searchsorted(self.edge_keys, keys), max(len(self.edge_keys) - 1, 0))
+        found = (self.edge_keys[positions] == keys) if len(self.edge_keys) else np.zeros(len(keys), dtype=bool)
+        return positions, found
+
+    def midpoints(self, a, b):
+        """
+        Índices dos pontos médios das arestas (a, b), criando os que ainda não existem.
+        """
+        keys = _edge_keys(a, b)
+        _, found = self._find(keys)
+        new_keys, first = np.unique(keys[~found], return_index=True)
+        if len(new_keys):
+            new_a, new_b = a[~found][first], b[~found][first]
+            points = (self.vertices[new_a] + self.vertices[new_b]) / 2
+            ids = np.arange(len(self.vertices), len(self.vertices) + len(points), dtype=np.int32)
+            self.vertices = np.concatenate([self.vertices, points])
+            self.inside = np.concatenate([self.inside, shapely.contains_xy(self.polygon, points[:, 0], points[:, 1])])
+            self.elevations = np.concatenate([self.elevations, np.full(len(points), np.nan)])
+
+            keys_all = np.concatenate([self.edge_keys, new_keys])
+            order = np.argsort(keys_all, kind='stable')
+            self.edge_keys = keys_all[order]
+            self.edge_midpoints = np.concatenate([self.edge_midpoints, ids])[order]
+            self.edge_split = np.concatenate([self.edge_split, np.zeros(len(new_keys), dtype=bool)])[order]
+
+        positions, _ = self._find(keys)
+        return self.edge_midpoints[positions]
+
+    def is_split(self, a, b):
+        positions, found = self._find(_edge_keys(a, b))
+        return found & self.edge_split[positions]
+
+    def sample(self):
+        # Amostra a elevação dos vértices internos que ainda não têm
+        missing = np.flatnonzero(self.inside & np.isnan(self.elevations))
+        if len(missing):
+            self.elevations[missing] = get_altitudes(self.vertices[missing], self.estimator)
+
+    def edge_errors(self, faces):
+        """
+        Erro da interpolação linear no ponto médio de cada aresta das faces, em metros.
+        """
+        a, b = faces.ravel(), np.roll(faces, -1, axis=1).ravel()
+        midpoints = self.midpoints(a, b)
+        self.sample()
+        interpolated = (self.elevations[a] + self.elevations[b]) / 2
+        errors = np.abs(self.elevations[midpoints] - interpolated)
+        # Aresta cujo ponto médio cai fora do polígono cruza a fronteira: sempre é dividida
+        return np.where(self.inside[midpoints], errors, np.inf).reshape(-1, 3).max(axis=1)
+
+    def red(self, faces):
+        """
+        Divide cada face em quatro, ligando os pontos médios das arestas.
+        """
+        a, b, c = faces.T
+        ab, bc, ca = self.midpoints(a, b), self.midpoints(b, c), self.midpoints(c, a)
+        self.edge_split[self._find(_edge_keys(np.concatenate([a, b, c]), np.concatenate([b, c, a])))[0]] = True
+        # Os filhos mantêm a orientação da face original
+        return np.concatenate([np.column_stack([a, ab, ca]), np.column_stack([ab, b, bc]),
+                               np.column_stack([ca, bc, c]), np.column_stack([ab, bc, ca])])
+
+
+def _clip_to_extent(mesh, faces, extent):
+    # Corta a malha, já no nível mais fino junto ao retângulo, em x <= x_max e y <= y_max. As linhas
+    # da treliça coincidem com y_max, mas x_max passa pelo vértice do meio dos triângulos da última
+    # coluna: esses ficam só com a metade de dentro, como o meio triângulo que fecha a treliça uniforme
+    _, _, x_max, y_max = extent
+    eps = 1e-9 * max(abs(x_max), abs(y_max), 1)
+    x = mesh.vertices[faces, 0]
+    straddling = np.flatnonzero((x < x_max - eps).any(axis=1) & (x > x_max + eps).any(axis=1))
+    if len(straddling):
+        beyond = np.argmax(x[straddling], axis=1)
+        before = np.argmin(x[straddling], axis=1)
+        rows = faces[straddling]
+        # O vértice de fora vai para o ponto médio da base, que fica sobre x_max; a orientação se mantém
+        faces = faces.copy()
+        faces[straddling, beyond] = mesh.midpoints(rows[np.arange(len(rows)), before],
+                                                   rows[np.arange(len(rows)), beyond])
+    centroids = mesh.vertices[faces].mean(axis=1)
+    return faces[(centroids[:, 0] < x_max) & (centroids[:, 1] < y_max)]
+
+
+def refine_surface(polygon, grid, include_bottom, estimator, tolerance=ADAPTIVE_TOLERANCE, levels=ADAPTIVE_LEVELS,
+                   extent=None):
+    """
+    Refina uma treliça grossa só onde o terreno pede, com subdivisão vermelho-verde.
+
+    A cada nível, cada face totalmente dentro do polígono tem a elevação amostrada
+    nos pontos médios das arestas; se o erro da interpolação linear passar de
+    ``tolerance`` em algum deles, a face é dividida em quatro (vermelho). As faces
+    que cruzam a fronteira são sempre divididas, para que o contorno tenha a mesma
+    resolução da treliça uniforme, e as totalmente fora nunca são. No fim, faces
+    vizinhas de arestas divididas em duas ou mais arestas são divididas em quatro e
+    as com uma só aresta dividida são cortadas ao meio (verde), deixando a malha sem
+    vértices soltos no meio das arestas.
+
+    Com ``extent``, a treliça grossa pode passar do retângulo da treliça uniforme
+    equivalente: as faces que cruzam os lados dele também são sempre divididas e,
+    no fim, a malha é cortada no retângulo, ficando com o mesmo contorno da treliça
+    uniforme.
+
+    As elevações amostradas aqui são estimadas de novo por update_z_dimension; com
+    o cache de elevações do estimador, essa segunda passada só faz consultas ao cache.
+
+    :param polygon: Polygon - a fronteira do mapa.
+    :param grid: TriangleMesh - a treliça grossa, já nas coordenadas do polígono.
+    :param include_bottom: bool - mantém ou não as faces fora do polígono.
+    :param estimator: GeoElevationEstimator - estimador usado para amostrar as elevações.
+    :param tolerance: float - erro máximo de elevação no ponto médio das arestas, em metros.
+    :param levels: int - número máximo de subdivisões de cada face da treliça grossa.
+    :param extent: tuple - (x_min, y_min, x_max, y_max) da treliça uniforme, nas coordenadas do polígono.
+    :return: TriangleMesh - a malha refinada com z = 1 dentro e z = 0 fora, como em assign_z_coordinate.
+    """
+    shapely.prepare(polygon)
+    mesh = _RefinementMesh(polygon, grid, estimator)
+    final = [np.empty((0, 3), dtype=np.int32)]
+    faces = mesh.faces
+
+    for _ in range(levels):
+        inside = mesh.inside[faces]
+        crossing = inside.any(axis=1) & ~inside.all(axis=1)
+        if extent is not None:
+            vertices = mesh.vertices[faces]
+            beyond = (vertices[:, :, 0] > extent[2]) | (vertices[:, :, 1] > extent[3])
+            crossing |= beyond.any(axis=1) & ~beyond.all(axis=1)
+        refine = crossing.copy()
+        candidates = np.flatnonzero(inside.all(axis=1))
+        refine[candidates] = mesh.edge_errors(faces[candidates]) > tolerance
+        # As faces que passaram no teste (ou estão fora) não são mais testadas
+        final.append(faces[~refine])
+        faces = mesh.red(faces[refine])
+        if not len(faces):
+            break
+    faces = np.concatenate(final + [faces])
+
+    # Fechamento: faces com duas ou mais arestas divididas, ou com uma aresta dividida mais de uma
+    # vez, viram vermelhas até a malha estabilizar
+    while True:
+        a, b = faces.ravel(), np.roll(faces, -1, axis=1).ravel()
+        split = mesh.is_split(a, b)
+        nested = np.zeros(len(a), dtype=bool)
+        if split.any():
+            m = mesh.midpoints(a[split], b[split])
+            nested[split] = mesh.is_split(a[split], m) | mesh.is_split(m, b[split])
+        split, nested = split.reshape(-1, 3), nested.reshape(-1, 3)
+        red = (split.sum(axis=1) >= 2) | nested.any(axis=1)
+        if not red.any():
+            break
+        faces = np.concatenate([faces[~red], mesh.red(faces[red])])
+
+    # Faces com uma única aresta dividida são cortadas ao meio, do ponto médio ao vértice oposto
+    green = split.any(axis=1)
+    edge = np.argmax(split[green], axis=1)
+    rotated = np.take_along_axis(faces[green], (edge[:, None] + np.arange(3)) % 3, axis=1)
+    a, b, c = rotated.T
+    m = mesh.midpoints(a, b)
+    faces = np.concatenate([faces[~green], np.column_stack([a, m, c]), np.column_stack([m, b, c])])
+    if extent is not None:
+        faces = _clip_to_extent(mesh, faces, extent)
+
+    result = TriangleMesh(np.column_stack([mesh.vertices, mesh.inside.astype(float)]), faces)
+    if include_bottom:
+        return result.remove_unused_vertices()
+    return result.select_faces(mesh.inside[faces].all(axis=1))
@@ -0,0 +1,173 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from src.elevatrion_estimator import BASE_PATH, MAX_TILES, GeoElevationEstimator
+from src.main import generate_city_stl_with_base, get_base_grid
+from src.planner import MAX_GROUP_TILES, job_footprints, plan_jobs
+from src.tile_catalog import TileCatalog
+from src.tile_store import convert_all
+import time
+import traceback
+
+# Catálogo compartilhado pelos processos de trabalho (definido em _init_worker)
+_catalog = None
+
+
+def map_jobs(maps, grid_step=0.1, include_bottom=True):
+    """
+    Build the job list for a group of maps.
+
+    Args:
+        maps (dict | list): ``{location_name: osmid}``, or a list of custom map names (no download).
+        grid_step (float): Triangle base of the grid.
+        include_bottom (bool): Generate the maps with a bottom.
+
+    Returns:
+        list: ``(osmid, location_name, grid_step, include_bottom)`` tuples.
+    """
+    if isinstance(maps, dict):
+        return [(osmid, location_name, grid_step, include_bottom) for location_name, osmid in maps.items()]
+    return [(0, location_name, grid_step, include_bottom) for location_name in maps]
+
+
+def _init_worker(catalog):
+    global _catalog
+    _catalog = catalog
+
+
+def _run_group(task):
+    # Cada grupo roda em um processo novo (max_tasks_per_child=1) e seus jobs compartilham o mesmo
+    # estimador, então as folhas carregadas por um job ficam disponíveis para os seguintes.
+    # O pico de memória de cada job é o maior pico das etapas no relatório do profiler: como cada
+    # etapa zera o pico do processo, ele não é somado ao dos jobs anteriores do grupo
+    group, max_tiles, force = task
+    # O cache de elevações de cada mapa é aberto em generate_city_stl_with_base, pelas folhas do mapa
+    estimator = GeoElevationEstimator(catalog=_catalog, max_tiles=max_tiles)
+    results = []
+    for osmid, location_name, grid_step, include_bottom in group:
+        start = time.perf_counter()
+        misses = estimator.misses
+        try:
+            report = generate_city_stl_with_base(osmid, location_name, grid_step, include_bottom, estimator,
+                                                 force=force)
+            error = None
+        except Exception:
+            # Sem o relatório, o pico do job não é conhecido
+            report = {'peak_rss_mb': float('nan'), 'stages': []}
+            error = traceback.format_exc()
+        results.append({
+            'location_name': location_name,
+            'status': 'ok' if error is None else 'erro',
+            'wall_s': time.perf_counter() - start,
+            'peak_mb': report['peak_rss_mb'],
+            'peak_is_per_job': all(stage['peak_is_per_stage'] for stage in report['stages']),
+            'tile_loads': estimator.misses - misses,
+            'error': error,
+        })
+    return results
+
+
+def _crashed(group, error):
+    return [{'location_name': location_name, 'status': 'erro', 'wall_s': 0.0, 'peak_mb': float('nan'),
+             'peak_is_per_job': False, 'tile_loads': 0, 'error': error}
+            for _, location_name, _, _ in group]
+
+
+def _run_tasks(tasks, processes, catalog):
+    # Um processo morto (pela falta de memória, por exemplo) quebra o pool e todas as tarefas ainda
+    # pendentes falham com BrokenProcessPool, sem indicar qual delas o matou. Essas tarefas rodam de
+    # novo uma a uma, em pools próprios; um grupo que ainda quebra é dividido em jobs, e o job que
+    # quebra sozinho é registrado como erro.
+    broken = []
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(catalog,),
+                             max_tasks_per_child=1) as executor:
+        futures = {executor.submit(_run_group, task): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                group_results = future.result()
+            except BrokenProcessPool:
+                broken.append(futures[future])
+                continue
+            for result in group_results:
+                print(f"Mapa {result['location_name']}: {result['status']} ({result['wall_s']:.1f}s)")
+                if result['error'] is not None:
+                    print(result['error'])
+            yield from group_results
+
+    for group, max_tiles, force in broken:
+        if len(tasks) > 1:
+            yield from _run_tasks([(group, max_tiles, force)], 1, catalog)
+        elif len(group) > 1:
+            yield from _run_tasks([([job], max_tiles, force) for job in group], 1, catalog)
+        else:
+            print(f"Mapa {group[0][1]}: o processo terminou de forma inesperada")
+            yield from _crashed(group, "O processo terminou de forma inesperada (por exemplo, falta de memória).")
+
+
+def run_batch(jobs, processes=None, base_path=BASE_PATH, plan=True, max_group_tiles=MAX_GROUP_TILES, force=False):
+    """
+    Run ``generate_city_stl_with_base`` jobs across a process pool.
+
+    Shared read-only resources are prepared once before the workers start: the TXT
+    tiles are converted to memory-mapped ``.tile`` files, the tile catalog is scanned
+    and the cached grids are generated, so the workers only map them. A failing job
+    is reported in the summary without stopping the others, also when its worker
+    process dies (e.g. killed for lack of memory).
+
+    With ``plan``, jobs that need the same elevation tiles are grouped (see
+    ``plan_jobs``) and each group runs in one worker with a shared estimator, so a tile
+    is loaded once for all the maps of the group instead of once per map.
+
+    Args:
+        jobs (list): ``(osmid, location_name, grid_step, include_bottom)`` tuples, see ``map_jobs``.
+        processes (int): Number of worker processes. Defaults to the number of CPUs.
+        base_path (str | Path): Folder with the elevation tiles.
+        plan (bool): Group the jobs by shared tiles. Otherwise every job runs on its own.
+        max_group_tiles (int): Maximum number of distinct tiles in a group.
+        force (bool): Run every stage again, ignoring the cached outputs.
+
+    Returns:
+        list: One dict per job with location_name, status, wall_s, peak_mb, peak_is_per_job,
+            tile_loads and error. ``peak_mb`` is the peak RSS of the job, the largest stage peak of
+            its profile (NaN for a failed job); where the peak cannot be reset between stages (no
+            ``/proc``), it is the peak of the group's process so far.
+    """
+    print("Preparando folhas e grids compartilhados...")
+    convert_all(base_path)
+    catalog = TileCatalog.scan(base_path)
+    for grid_step in sorted({job[2] for job in jobs if job[3]}):
+        get_base_grid(grid_step)
+
+    if plan:
+        print("Agrupando mapas por folhas de elevação...")
+        footprints = job_footprints(jobs, catalog)
+        groups, stats = plan_jobs(jobs, footprints, max_group_tiles)
+        tasks = [(group, max_group_tiles, force) for group in groups]
+    else:
+        tasks = [([job], MAX_TILES, force) for job in jobs]
+
+    results = list(_run_tasks(tasks, processes, catalog))
+
+    print_summary(results)
+    if plan:
+        # A previsão do agrupamento conta todas as folhas de cada grupo; os carregamentos feitos também
+        # dependem do cache de elevações e das etapas já prontas, que evitam carregar folhas
+        tile_loads = sum(result['tile_loads'] for result in results)
+        print(f"{len(jobs)} mapas em {len(groups)} grupos. Carregamentos de folhas previstos: "
+              f"{stats['planned_loads']} agrupando, {stats['naive_loads']} sem agrupar "
+              f"({stats['saved_loads']} a menos pelo agrupamento)")
+        print(f"Carregamentos de folhas feitos: {tile_loads}")
+        if stats['oversized_jobs']:
+            print(f"{stats['oversized_jobs']} mapas precisam de mais de {max_group_tiles} folhas "
+                  f"e rodaram sozinhos (aumente max_group_tiles para agrupá-los)")
+    return results
+
+
+def print_summary(results):
+    columns = ['location_name', 'status', 'wall_s', 'peak_mb', 'tile_loads']
+    width = max([len(columns[0])] + [len(result['location_name']) for result in results])
+    print(f"{columns[0]:<{width}} " + " ".join(f"{column:>10}" for column in columns[1:]))
+    for result in results:
+        print(f"{result['location_name']:<{width}} {result['status']:>10} "
+              f"{result['wall_s']:>10.1f} {result['peak_mb']:>10.1f} {result['tile_loads']:>10}")
+    if not all(result['peak_is_per_job'] for result in results if result['status'] == 'ok'):
+        print("peak_mb: pico do processo do grupo até o fim de cada mapa (o pico por mapa precisa de /proc)")
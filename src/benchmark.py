@@ -0,0 +1,247 @@
+from multiprocessing import Pool
+from pathlib import Path
+from src.elevatrion_estimator import GeoElevationEstimator
+from src.grid import generate_triangle_lattice
+from src.input_output import load_wkt, save_wkt
+from src.poly_scaler import PolyScaler
+from src.profiling import PipelineProfiler
+from src.surface import assign_z_coordinate, update_z_dimension
+from src.tile_store import convert_all
+from src.transform import multipolygon_to_stl, normalize_multipolygon, wkt_to_polygon
+from shapely.geometry import Polygon
+import json
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+
+BENCHMARK_FOLDER = Path("data/benchmark")
+# Diâmetro aproximado (em graus) de cada fronteira sintética, de uma cidade até um país
+SIZES = {'city': 0.3, 'region': 1.0, 'state': 3.0, 'country': 8.0}
+GRID_STEPS = (0.5, 0.25, 0.1)
+# Centro das fronteiras sintéticas (coordenadas na ordem das colunas do TXT do INPE)
+CENTER = (-47.0, -15.0)
+# Tamanho de uma folha do Topodata, na ordem das colunas do TXT
+SHEET_SIZE = (1.5, 1.0)
+CELLS_PER_DEGREE = 120  # As folhas reais têm 3600 (~30 m); menos células deixam o benchmark rápido
+
+
+def synthetic_elevation(x, y):
+    # Relevo suave com alguma rugosidade, em metros
+    return 600 + 400 * np.sin(1.3 * x) * np.cos(1.7 * y) + 40 * np.sin(23 * x + 17 * y)
+
+
+def _sheet_name(x, y):
+    # Mesmo padrão dos arquivos do INPE, ex.: 23_465cor_rec.txt e 23_45_cor_rec.txt
+    lon_code = f"{int(abs(x))}{'5' if abs(x) % 1 else '_'}"
+    return f"{int(abs(y)):02d}_{lon_code}cor_rec.txt"
+
+
+def write_synthetic_tiles(folder, bounds, cells_per_degree=CELLS_PER_DEGREE):
+    """
+    Write synthetic tiles in the INPE Topodata TXT format covering a bounding box.
+
+    Args:
+        folder (str | Path): Output folder.
+        bounds (tuple): ``(x_min, y_min, x_max, y_max)`` to cover, in the TXT column order.
+        cells_per_degree (int): Grid resolution of the tiles.
+
+    Returns:
+        list: Paths of the written TXT files.
+    """
+    os.makedirs(folder, exist_ok=True)
+    width, height = SHEET_SIZE
+    x_min, y_min, x_max, y_max = bounds
+    paths = []
+    for x0 in np.arange(np.floor(x_min / width) * width, x_max, width):
+        for y0 in np.arange(np.floor(y_min / height) * height, y_max, height):
+            path = Path(folder) / _sheet_name(x0, y0)
+            paths.append(path)
+            if path.exists():
+                continue
+            xs = x0 + np.arange(int(round(width * cells_per_degree)) + 1) / cells_per_degree
+            ys = y0 + np.arange(int(round(height * cells_per_degree)) + 1) / cells_per_degree
+            xx, yy = np.meshgrid(xs, ys, indexing='ij')
+            columns = np.column_stack([xx.ravel(), yy.ravel(), synthetic_elevation(xx, yy).ravel()])
+            np.savetxt(path, columns, fmt='%.8f %.8f %.2f')
+    return paths
+
+
+def synthetic_boundary(size, center=CENTER, n_vertices=400, seed=0):
+    """
+    Build an irregular, star-shaped boundary polygon.
+
+    Args:
+        size (float): Approximate diameter, in degrees.
+        center (tuple): Center of the polygon.
+        n_vertices (int): Number of vertices of the boundary.
+        seed (int): Seed for the irregularities.
+
+    Returns:
+        Polygon: The boundary.
+    """
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    # Raio com algumas ondulações de baixa frequência, como uma fronteira política
+    radius = np.ones(n_vertices)
+    for frequency in range(2, 9):
+        radius += rng.normal(0, 0.15 / frequency) * np.cos(frequency * angles + rng.uniform(0, 2 * np.pi))
+    radius *= size / 2 / radius.max()
+    return Polygon(np.column_stack([center[0] + radius * np.cos(angles), center[1] + radius * np.sin(angles)]))
+
+
+def prepare_data(folder=BENCHMARK_FOLDER, sizes=SIZES, cells_per_degree=CELLS_PER_DEGREE):
+    """
+    Generate the synthetic tiles and boundaries once, reusing them on later runs.
+
+    Args:
+        folder (str | Path): Benchmark data folder.
+        sizes (dict): Diameter, in degrees, of each boundary.
+        cells_per_degree (int): Grid resolution of the tiles.
+
+    Returns:
+        dict: Path of the boundary WKT of each size.
+    """
+    folder = Path(folder)
+    wkt_paths = {}
+    for seed, (name, size) in enumerate(sizes.items()):
+        wkt_paths[name] = folder / "maps" / f"{name}.wkt"
+        if not wkt_paths[name].exists():
+            os.makedirs(wkt_paths[name].parent, exist_ok=True)
+            save_wkt(synthetic_boundary(size, seed=seed).wkt, wkt_paths[name])
+
+    half = max(sizes.values()) / 2
+    write_synthetic_tiles(folder / "elevation", (CENTER[0] - half, CENTER[1] - half, CENTER[0] + half,
+                                                 CENTER[1] + half), cells_per_degree)
+    convert_all(folder / "elevation")
+    return wkt_paths
+
+
+def run_case(case):
+    """
+    Run the pipeline stages for one boundary and grid step, timing each of them.
+
+    Args:
+        case (tuple): ``(name, wkt_path, grid_step, include_bottom, folder)``.
+
+    Returns:
+        dict: The profiler report of the case.
+    """
+    name, wkt_path, grid_step, include_bottom, folder = case
+    polygon = wkt_to_polygon(load_wkt(wkt_path))
+    scaler = PolyScaler().fit(polygon)
+    profiler = PipelineProfiler(f"{name}_{grid_step}")
+
+    with profiler.stage('generate_triangle_lattice') as stage:
+        boundary = None if include_bottom else scaler.transform(polygon)
+        grid = scaler.inverse_transform(generate_triangle_lattice(triangle_base=grid_step, boundary=boundary,
+                                                                  buffer=grid_step))
+        stage['triangles'] = len(grid)
+    with profiler.stage('assign_z_coordinate') as stage:
+        mesh = assign_z_coordinate(polygon, grid, include_bottom)
+        stage['triangles'] = len(mesh)
+    with profiler.stage('GeoElevationEstimator'):
+        estimator = GeoElevationEstimator(base_path=Path(folder) / "elevation", max_tiles=64)
+        estimator.preload(polygon.bounds)
+    with profiler.stage('update_z_dimension') as stage:
+        mesh = update_z_dimension(mesh, estimator)
+        stage.update(unique_vertices=len(mesh.vertices), knn_queries=estimator.queries)
+    with profiler.stage('normalize_multipolygon'):
+        mesh = normalize_multipolygon(mesh, copy=False)
+    with profiler.stage('multipolygon_to_stl') as stage:
+        stage['triangles'] = multipolygon_to_stl(mesh, Path(folder) / f"{name}.stl")
+
+    report = profiler.report()
+    report.update(size=name, grid_step=grid_step, include_bottom=include_bottom,
+                  triangles=len(mesh), tile_loads=estimator.misses)
+    return report
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmark(sizes=SIZES, grid_steps=GRID_STEPS, include_bottom=False, folder=BENCHMARK_FOLDER):
+    """
+    Benchmark the pipeline on synthetic data, with no network access.
+
+    Every case runs in a fresh process, so its peak memory is not affected by the
+    previous ones. The results are saved in ``folder/results`` with the current commit.
+
+    Args:
+        sizes (dict): Diameter, in degrees, of each boundary.
+        grid_steps (tuple): Grid steps to run for each boundary.
+        include_bottom (bool): Run with the bottom (full lattice) instead of the boundary footprint.
+        folder (str | Path): Benchmark data folder.
+
+    Returns:
+        dict: Machine information and the report of every case.
+    """
+    wkt_paths = prepare_data(folder, sizes)
+    cases = [(name, wkt_paths[name], grid_step, include_bottom, folder) for name in sizes for grid_step in grid_steps]
+
+    reports = []
+    with Pool(1, maxtasksperchild=1) as pool:
+        for report in pool.imap(run_case, cases):
+            print(f"{report['size']:>8} {report['grid_step']:>6}: {report['total_wall_s']:.2f}s, "
+                  f"{report['triangles']} triângulos, pico {report['peak_rss_mb']:.0f} MB")
+            reports.append(report)
+
+    results = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'cases': reports,
+    }
+    results_path = Path(folder) / "results" / f"{results['commit']}_{reports[0]['started_at'][:19].replace(':', '')}.json"
+    os.makedirs(results_path.parent, exist_ok=True)
+    with open(results_path, 'w') as file:
+        json.dump(results, file, indent=4)
+    print(f"Resultados salvos em {results_path}")
+    return results
+
+
+def compare_results(base_path, new_path):
+    """
+    Print the wall time and peak memory of each stage of two benchmark runs side by side.
+
+    Args:
+        base_path (str | Path): Results JSON of the reference run.
+        new_path (str | Path): Results JSON of the run to compare.
+    """
+    with open(base_path) as file:
+        base = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+
+    base_cases = {(case['size'], case['grid_step']): case for case in base['cases']}
+    print(f"{base['commit']} -> {new['commit']}")
+    print(f"{'case':>16} {'stage':>24} {'base_s':>9} {'new_s':>9} {'ratio':>7} {'base_mb':>9} {'new_mb':>9}")
+    for case in new['cases']:
+        reference = base_cases.get((case['size'], case['grid_step']))
+        if reference is None:
+            continue
+        base_stages = {stage['stage']: stage for stage in reference['stages']}
+        for stage in case['stages']:
+            old = base_stages.get(stage['stage'])
+            if old is None:
+                continue
+            print(f"{case['size'] + ' ' + str(case['grid_step']):>16} {stage['stage']:>24} {old['wall_s']:>9.3f} "
+                  f"{stage['wall_s']:>9.3f} {stage['wall_s'] / max(old['wall_s'], 1e-9):>7.2f} "
+                  f"{old['peak_rss_mb']:>9.0f} {stage['peak_rss_mb']:>9.0f}")
+
+
+if __name__ == '__main__':
+    # Uso: python -m src.benchmark            -> roda o benchmark
+    #      python -m src.benchmark base.json nova.json  -> compara dois resultados
+    if len(sys.argv) == 3:
+        compare_results(sys.argv[1], sys.argv[2])
+    else:
+        run_benchmark()
@@ -0,0 +1,96 @@
+from src.elevatrion_estimator import KnnTile, RasterTile, METHODS
+from src.tile_store import open_tile, read_txt, tile_is_current, tile_path
+import numpy as np
+import sys
+import time
+
+
+def _load_grid(filepath):
+    if tile_is_current(filepath):
+        header, grid = open_tile(tile_path(filepath))
+    else:
+        header, grid = read_txt(filepath)
+    return header, np.asarray(grid)
+
+
+def _build_tile(method, filepath, header, grid):
+    if method == 'knn':
+        return KnnTile.from_grid(filepath, header, grid)
+    return RasterTile(filepath, header, grid, method)
+
+
+def _holdout(header, grid, n_points, rng):
+    # Mantém as linhas e colunas pares como fonte e usa os nós descartados como verdade
+    source = np.ascontiguousarray(grid[::2, ::2])
+    source_header = dict(header, rows=source.shape[0], cols=source.shape[1],
+                         dlat=2 * header['dlat'], dlon=2 * header['dlon'])
+
+    rows = rng.integers(0, 2 * (source.shape[0] - 1) + 1, size=4 * n_points)
+    cols = rng.integers(0, 2 * (source.shape[1] - 1) + 1, size=4 * n_points)
+    held_out = ((rows % 2 == 1) | (cols % 2 == 1)) & ~np.isnan(grid[rows, cols])
+    rows, cols = rows[held_out][:n_points], cols[held_out][:n_points]
+
+    lats = header['lat0'] + cols * header['dlat']
+    lons = header['lon0'] + rows * header['dlon']
+    return source_header, source, lats, lons, grid[rows, cols].astype(np.float64)
+
+
+def compare_methods(filepath, n_points=100_000, seed=0):
+    """
+    Compare the accuracy and speed of the elevation estimation methods on one tile.
+
+    Accuracy is measured by hold-out: every other row and column of the tile is
+    used as the source grid and the estimators are evaluated on the samples that
+    were left out. Speed is measured on the full tile, with random query points.
+
+    Args:
+        filepath (str | Path): Path to the ``*cor_rec.txt`` tile (its ``.tile`` is used if present).
+        n_points (int): Number of query points for each measurement.
+        seed (int): Seed for the random query points.
+
+    Returns:
+        list: One dict per method with load time, query time, throughput, memory and errors.
+    """
+    rng = np.random.default_rng(seed)
+    header, grid = _load_grid(filepath)
+    source_header, source, eval_lats, eval_lons, truth = _holdout(header, grid, n_points, rng)
+
+    tile = RasterTile(filepath, header, grid)
+    lats = rng.uniform(tile.lat_min, tile.lat_max, n_points)
+    lons = rng.uniform(tile.lon_min, tile.lon_max, n_points)
+
+    results = []
+    for method in METHODS:
+        start = time.perf_counter()
+        tile = _build_tile(method, filepath, header, grid)
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tile.estimate(lats, lons, k=3)
+        query_time = time.perf_counter() - start
+
+        errors = _build_tile(method, filepath, source_header, source).estimate(eval_lats, eval_lons, k=3) - truth
+        results.append({
+            'method': method,
+            'load_s': load_time,
+            'query_s': query_time,
+            'points_per_s': n_points / query_time,
+            'memory_mb': tile.nbytes / 1024 ** 2,
+            'mae_m': np.nanmean(np.abs(errors)),
+            'rmse_m': np.sqrt(np.nanmean(errors ** 2)),
+            'max_error_m': np.nanmax(np.abs(errors)),
+        })
+    return results
+
+
+def print_report(results):
+    columns = ['method', 'load_s', 'query_s', 'points_per_s', 'memory_mb', 'mae_m', 'rmse_m', 'max_error_m']
+    print(" ".join(f"{column:>13}" for column in columns))
+    for result in results:
+        print(" ".join(f"{result[column]:>13}" if isinstance(result[column], str) else f"{result[column]:>13.4f}"
+                       for column in columns))
+
+
+if __name__ == '__main__':
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'data/elevation/23_465cor_rec.txt'
+    print_report(compare_methods(filepath))
@@ -0,0 +1,297 @@
+from src.mesh import TriangleMesh
+import numpy as np
+import shapely
+
+# Componentes da metade superior de uma quádrica 4x4 simétrica; as fora da diagonal contam duas vezes
+_ROWS, _COLUMNS = np.triu_indices(4)
+_WEIGHTS = np.where(_ROWS == _COLUMNS, 1.0, 2.0)
+# Rodadas de escolha de colapsos independentes por passada: as primeiras pegam quase todos
+SELECTION_ROUNDS = 4
+# Menor razão entre o dobro da área em planta e o quadrado da maior aresta aceita em uma face nova
+# (a altura relativa à maior aresta): abaixo disso a face é uma lasca, que pode inverter ao virar float32
+MIN_FACE_QUALITY = 1e-2
+
+
+def _edge_keys(a, b):
+    # Chave da aresta a -> b (os índices cabem em 32 bits)
+    return (a.astype(np.int64) << 32) | b.astype(np.int64)
+
+
+def _signed_areas(vertices, faces):
+    p0, p1, p2 = vertices[faces[:, 0], :2], vertices[faces[:, 1], :2], vertices[faces[:, 2], :2]
+    return (p1[:, 0] - p0[:, 0]) * (p2[:, 1] - p0[:, 1]) - (p2[:, 0] - p0[:, 0]) * (p1[:, 1] - p0[:, 1])
+
+
+def vertical_quadrics(vertices, faces):
+    """
+    Sum, for each vertex, the quadrics of the planes of the faces around it.
+
+    Each plane is scaled so that ``z + a * x + b * y + d`` is the vertical distance to
+    it, so the quadric of a vertex measures squared vertical distances, the error that
+    matters for a height field.
+
+    Args:
+        vertices (np.ndarray): ``(n, 3)`` vertex coordinates.
+        faces (np.ndarray): ``(m, 3)`` vertex indices of each face.
+
+    Returns:
+        np.ndarray: ``(n, 10)`` upper triangle of the 4x4 quadric of each vertex.
+    """
+    p0, p1, p2 = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    normals = np.cross(p1 - p0, p2 - p0)
+    # Faces sem área em planta (paredes verticais) não definem um plano de altura
+    flat = normals[:, 2] != 0
+    planes = np.zeros((len(faces), 4))
+    planes[flat, :3] = normals[flat] / normals[flat, 2:3]
+    planes[:, 3] = -(planes[:, :3] * p0).sum(axis=1)
+
+    corners = faces.ravel()
+    quadrics = np.empty((len(vertices), len(_ROWS)))
+    for i, (row, column) in enumerate(zip(_ROWS, _COLUMNS)):
+        quadrics[:, i] = np.bincount(corners, weights=np.repeat(planes[:, row] * planes[:, column], 3),
+                                     minlength=len(vertices))
+    return quadrics
+
+
+def _monomials(vertices):
+    # Produtos das coordenadas homogêneas de cada vértice, na ordem das componentes das quádricas:
+    # o erro de um vértice na posição v é (quádrica * monômios de v).sum()
+    h = np.column_stack([vertices, np.ones(len(vertices))])
+    return h[:, _ROWS] * h[:, _COLUMNS] * _WEIGHTS
+
+
+def _ranges(starts, counts):
+    # Índices de vários intervalos [start, start + count) concatenados, e o intervalo de cada índice
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum()), np.repeat(np.arange(len(starts)), counts)
+
+
+def _cheapest(values, owners, counts):
+    # Posição do primeiro mínimo de cada grupo de valores consecutivos (todos os grupos não vazios)
+    cheapest = np.minimum.reduceat(values, np.cumsum(counts) - counts)
+    minima = np.flatnonzero(values == cheapest[owners])
+    return minima[np.r_[True, owners[minima][1:] != owners[minima][:-1]]], cheapest
+
+
+def _face_quality(vertices, faces):
+    # Dobro da área em planta (com sinal) dividido pelo quadrado da maior aresta em planta
+    p = vertices[faces, :2]
+    edges = np.stack([p[:, 1] - p[:, 0], p[:, 2] - p[:, 1], p[:, 0] - p[:, 2]], axis=1)
+    longest = (edges ** 2).sum(axis=2).max(axis=1)
+    return _signed_areas(vertices, faces) / np.maximum(longest, np.finfo(float).tiny)
+
+
+def _folds(vertices, faces, order, targets, starts, counts, options):
+    # Para cada colapso proposto (o canto options[i] da ordem por vértice, cujas faces estão nas
+    # posições starts[i] .. starts[i] + counts[i] - 1 de order), se alguma face ficaria invertida,
+    # nula ou tão fina quanto uma lasca (ver MIN_FACE_QUALITY). As faces que contêm a aresta
+    # colapsada somem, não dobram.
+    positions, proposals = _ranges(starts, counts)
+    face_ids, corners = np.divmod(order[positions], 3)
+    moved_to = targets[order[options]][proposals]
+    new_faces = faces[face_ids]
+    new_faces[np.arange(len(positions)), corners] = moved_to
+    removed = (new_faces == moved_to[:, None]).sum(axis=1) > 1
+    folded = ~removed & (_face_quality(vertices, new_faces) < MIN_FACE_QUALITY)
+    return np.bincount(proposals[folded], minlength=len(starts)) > 0
+
+
+def boundary_vertices(faces, n_vertices):
+    """
+    Flag the vertices on the border of the mesh (on an edge used by a single face).
+
+    Args:
+        faces (np.ndarray): ``(m, 3)`` vertex indices of each face.
+        n_vertices (int): Number of vertices.
+
+    Returns:
+        np.ndarray: Boolean mask over the vertices.
+    """
+    edges = np.sort(np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1)
+    keys, counts = np.unique(_edge_keys(edges[:, 0], edges[:, 1]), return_counts=True)
+    border = keys[counts == 1]
+    mask = np.zeros(n_vertices, dtype=bool)
+    mask[(border >> 32).astype(np.int64)] = True
+    mask[(border & 0xFFFFFFFF).astype(np.int64)] = True
+    return mask
+
+
+def vertical_distances(points, mesh):
+    """
+    Measure the vertical distance from points to a height-field mesh.
+
+    Each point is located in plan view among the faces of the mesh (with an
+    ``STRtree``) and compared with the linear interpolation of the face it falls in.
+
+    Args:
+        points (np.ndarray): ``(n, 3)`` point coordinates.
+        mesh (TriangleMesh): 3D mesh, a height field over x and y.
+
+    Returns:
+        np.ndarray: ``|z - z of the mesh below the point|`` of each point, NaN for the
+            points outside the mesh in plan view.
+    """
+    triangles = mesh.vertices[mesh.faces]
+    tree = shapely.STRtree(shapely.polygons(triangles[:, :, :2]))
+    point_ids, face_ids = tree.query(shapely.points(points[:, :2]), predicate='intersects')
+    # Um ponto sobre uma aresta cai nas duas faces, que dão a mesma altura: fica a primeira
+    point_ids, first = np.unique(point_ids, return_index=True)
+    p0, p1, p2 = (triangles[face_ids[first], i] for i in range(3))
+    # Coordenadas baricêntricas em planta
+    d1, d2, d = p1[:, :2] - p0[:, :2], p2[:, :2] - p0[:, :2], points[point_ids, :2] - p0[:, :2]
+    det = d1[:, 0] * d2[:, 1] - d2[:, 0] * d1[:, 1]
+    u = (d[:, 0] * d2[:, 1] - d2[:, 0] * d[:, 1]) / det
+    v = (d1[:, 0] * d[:, 1] - d[:, 0] * d1[:, 1]) / det
+    heights = p0[:, 2] + u * (p1[:, 2] - p0[:, 2]) + v * (p2[:, 2] - p0[:, 2])
+    distances = np.full(len(points), np.nan)
+    distances[point_ids] = np.abs(points[point_ids, 2] - heights)
+    return distances
+
+
+def decimate(mesh, target_faces=None, max_error=None):
+    """
+    Simplify a terrain mesh by quadric-error edge collapses.
+
+    Each pass picks, for every vertex, the neighbour it can be merged into with the
+    smallest vertical quadric error without folding a face over in plan view or leaving
+    a sliver (see ``MIN_FACE_QUALITY``). The cheaper half of those collapses compete,
+    and a set of them with no two sources adjacent is applied at once, cheapest first,
+    so every pass is a few array operations over the whole mesh. Vertices only move onto existing vertices
+    (half-edge collapse), so the result keeps the original sampled points, and the
+    vertices on the border of the mesh never move, so the outline is kept exactly.
+    The faces come out counter-clockwise in plan view (normals pointing up).
+
+    Args:
+        mesh (TriangleMesh): 3D mesh, a height field over x and y (e.g. the output of
+            ``normalize_multipolygon``).
+        target_faces (int): Stop once the mesh has at most this many faces.
+        max_error (float): Largest vertical error allowed for a collapse, in the units of z:
+            the distance from the new position to the original planes merged into the vertex.
+
+    Returns:
+        tuple: The simplified ``TriangleMesh`` and a report with the face and vertex counts
+            before and after, the reduction, ``max_error`` (the measured vertical distance
+            from the removed vertices to the simplified surface, see ``vertical_distances``)
+            and, for each pass, ``quadric_error``: the square root of the largest collapse
+            cost so far. That is the vertical error summed in quadrature over every plane
+            merged into a vertex, so it grows with the merged area and is far above the
+            measured error when many collapses stack up. ``degenerate_faces`` counts the faces
+            with zero or negative plan area once the vertices are rounded to float32, as
+            written to the STL; it should be 0.
+    """
+    if target_faces is None and max_error is None:
+        raise ValueError("Informe target_faces ou max_error.")
+    target_faces = 0 if target_faces is None else target_faces
+    max_cost = np.inf if max_error is None else max_error ** 2
+
+    vertices, faces = mesh.vertices, mesh.faces.astype(np.int64)
+    n = len(vertices)
+    # Todas as faces passam a ter a mesma orientação (anti-horária em planta, normais para cima):
+    # assim cada aresta interna aparece uma vez em cada sentido e uma dobra é uma área negativa
+    clockwise = _signed_areas(vertices, faces) < 0
+    faces[clockwise] = faces[clockwise][:, [0, 2, 1]]
+    quadrics = vertical_quadrics(vertices, faces)
+    monomials = _monomials(vertices)
+    locked = boundary_vertices(faces, n)
+    tiebreak = np.random.default_rng(0).permutation(n)
+    sampled = np.zeros(n, dtype=bool)
+    sampled[faces] = True
+    report = {'faces_in': len(faces), 'vertices_in': int(sampled.sum()), 'passes': []}
+    quadric_error = 0.0
+
+    while len(faces) > target_faces:
+        # Cada canto propõe mover o seu vértice até o vértice seguinte da face; com as faces orientadas,
+        # isso cobre cada aresta interna nos dois sentidos uma única vez
+        sources, targets = faces.ravel(), np.roll(faces, -1, axis=1).ravel()
+        self_costs = np.einsum('ij,ij->i', quadrics, monomials)
+        costs = np.einsum('ij,ij->i', quadrics[sources], monomials[targets]) + self_costs[targets]
+        costs[locked[sources] | (costs > max_cost)] = np.inf
+
+        # Os cantos agrupados por vértice: o grupo de cada vértice dá as suas faces e os seus destinos
+        order = np.argsort(sources, kind='stable')
+        counts = np.bincount(sources, minlength=n)
+        starts = np.cumsum(counts) - counts
+        sorted_costs = costs[order]
+
+        # O destino mais barato de cada vértice que não dobra nenhuma face em planta. Primeiro só o
+        # mais barato é testado; os vértices em que ele dobra testam todos os destinos de uma vez
+        best_option = np.full(n, -1)
+        pending = np.flatnonzero(counts)
+        options, owners = _ranges(starts[pending], counts[pending])
+        best, cheapest = _cheapest(sorted_costs[options], owners, counts[pending])
+        movable = np.isfinite(cheapest)
+        pending, best = pending[movable], options[best[movable]]
+        failed = _folds(vertices, faces, order, targets, starts[pending], counts[pending], best)
+        best_option[pending[~failed]] = best[~failed]
+
+        pending = pending[failed]
+        if len(pending):
+            options, owners = _ranges(starts[pending], counts[pending])
+            option_costs = sorted_costs[options]
+            tested = np.flatnonzero(np.isfinite(option_costs))
+            folded = _folds(vertices, faces, order, targets, starts[pending][owners[tested]],
+                            counts[pending][owners[tested]], options[tested])
+            option_costs[tested[folded]] = np.inf
+            best, cheapest = _cheapest(option_costs, owners, counts[pending])
+            movable = np.isfinite(cheapest)
+            best_option[pending[movable]] = options[best[movable]]
+
+        sources = np.flatnonzero(best_option >= 0)
+        if not len(sources):
+            break
+        targets, costs = targets[order[best_option[sources]]], sorted_costs[best_option[sources]]
+        # Só a metade mais barata disputa a passada, para que a ordem dos colapsos siga o erro
+        cheaper = costs <= np.partition(costs, len(costs) // 2)[len(costs) // 2]
+        sources, targets, costs = sources[cheaper], targets[cheaper], costs[cheaper]
+
+        # Conjunto independente: um colapso entra quando nenhum vizinho ainda disponível tem um colapso
+        # mais barato, e os vizinhos dos escolhidos saem da disputa para a rodada seguinte. Como dois
+        # escolhidos nunca são vizinhos, cada face muda no máximo uma vez por passada. Empates, comuns
+        # em regiões planas, são desfeitos em ordem aleatória
+        ranks = np.empty(len(sources), dtype=np.int64)
+        ranks[np.lexsort((tiebreak[sources], costs))] = np.arange(len(sources))
+        available = np.ones(len(sources), dtype=bool)
+        selected = np.zeros(len(sources), dtype=bool)
+        used, corner_faces = np.flatnonzero(counts), order // 3
+        for _ in range(SELECTION_ROUNDS):
+            vertex_ranks = np.full(n, len(sources))
+            vertex_ranks[sources[available]] = ranks[available]
+            # Menor rank entre as faces de cada vértice, com os cantos já agrupados por vértice
+            neighbourhood = np.empty(n, dtype=np.int64)
+            neighbourhood[used] = np.minimum.reduceat(vertex_ranks[faces].min(axis=1)[corner_faces], starts[used])
+            new = available & (neighbourhood[sources] == ranks)
+            selected |= new
+            is_new = np.zeros(n, dtype=bool)
+            is_new[sources[new]] = True
+            near = np.zeros(n, dtype=bool)
+            near[faces[is_new[faces].any(axis=1)]] = True
+            available &= ~near[sources]
+            if not available.any():
+                break
+        winners = np.flatnonzero(selected)
+        # Cada colapso remove duas faces: na última passada só entram os necessários para chegar ao alvo
+        needed = -(-(len(faces) - target_faces) // 2)
+        winners = winners[np.argsort(costs[winners], kind='stable')[:needed]]
+
+        destination = np.full(n, -1)
+        destination[sources[winners]] = targets[winners]
+        # Vários vértices podem ser unidos ao mesmo destino na mesma passada
+        np.add.at(quadrics, targets[winners], quadrics[sources[winners]])
+        faces = np.where(destination[faces] >= 0, destination[faces], faces)
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+        quadric_error = max(quadric_error, float(np.sqrt(max(costs[winners].max(), 0))))
+        report['passes'].append({'faces': len(faces), 'collapses': len(winners), 'quadric_error': quadric_error})
+
+    # O erro de verdade: a distância vertical dos vértices removidos até a superfície simplificada
+    removed = sampled.copy()
+    removed[faces] = False
+    error = 0.0
+    if removed.any():
+        error = float(np.nanmax(vertical_distances(vertices[removed], TriangleMesh(vertices, faces))))
+    result = TriangleMesh(vertices, faces).remove_unused_vertices()
+    # O STL grava os vértices em float32: confere que nenhuma face fica nula ou invertida depois disso
+    degenerate = int((_signed_areas(result.vertices.astype(np.float32), result.faces) <= 0).sum())
+    report.update(faces_out=len(result), vertices_out=len(result.vertices),
+                  reduction=1 - len(result) / max(report['faces_in'], 1), max_error=error,
+                  degenerate_faces=degenerate)
+    return result, report
@@ -1,13 +1,22 @@
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from src.tile_store import convert_zip
 from tqdm import tqdm
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+import hashlib
 import os
-import pandas as pd
 import requests
+import shutil
+import sys
+import threading
+import time
 import zipfile
 import re
 
-BASE_URL = "http://www.dsr.inpe.br/topodata/data/txt/{sheet_id}"
+# URL das folhas TXT do Topodata. Pode apontar para um espelho HTTP ou para uma pasta local
+# (caminho ou file://) com os mesmos ZIPs, por exemplo em máquinas sem acesso à internet
+BASE_URL = os.environ.get("TOPODATA_URL", "http://www.dsr.inpe.br/topodata/data/txt")
 # IDs do estado de São Paulo
 ID_LIST = [
     "22_54_txt.zip", "19_525txt.zip", "20_525txt.zip", "21_525txt.zip", "22_525txt.zip", "19_51_txt.zip", "20_51_txt.zip", 
@@ -16,48 +25,200 @@ ID_LIST = [
     "22_465txt.zip", "23_465txt.zip", "22_45_txt.zip", "23_45_txt.zip",
 ]
 ELEVATION_FOLDER = Path("data/elevation")
+ZIP_FOLDER = ELEVATION_FOLDER / "zip"
+MAX_WORKERS = 4
+RETRIES = 5
+BACKOFF = 1.0  # Espera inicial entre tentativas, em segundos (dobra a cada falha)
+TIMEOUT = 60
+BLOCK_SIZE = 1024 * 1024
 
-def download_id_list():
-    url = "http://www.dsr.inpe.br/topodata/data/txt"
-    response = requests.get(url)
+_local = threading.local()
+
+
+def _session():
+    # Uma sessão por thread, para reaproveitar as conexões sem compartilhar estado entre threads
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def _local_folder(base_url):
+    # Pasta local do espelho, ou None quando a base é uma URL HTTP
+    parsed = urlparse(str(base_url))
+    if parsed.scheme == "file":
+        return Path(url2pathname(parsed.path))
+    if parsed.scheme in ("http", "https"):
+        return None
+    return Path(base_url)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _checksum_path(path):
+    return path.with_name(path.name + ".sha256")
+
+
+def download_id_list(base_url=BASE_URL):
+    """
+    List the ZIP files available at the Topodata base URL or local mirror.
+
+    Args:
+        base_url (str): HTTP URL, ``file://`` URL or folder with the ZIP files.
+
+    Returns:
+        list: Names of the ZIP files.
+    """
+    folder = _local_folder(base_url)
+    if folder is not None:
+        return sorted(path.name for path in folder.glob("*.zip"))
+    response = _session().get(base_url, timeout=TIMEOUT)
+    response.raise_for_status()
     id_list = re.findall(r'href="([^"]*\.zip)"', response.text)
     return id_list
 
+
+def _remote_size(url):
+    response = _session().head(url, timeout=TIMEOUT, allow_redirects=True)
+    if not response.ok or "Content-Length" not in response.headers:
+        return None
+    return int(response.headers["Content-Length"])
+
+
+def _is_complete(path, size):
+    # Um arquivo só existe depois de baixado por inteiro (ele é renomeado a partir do .part).
+    # Confere o tamanho informado pela origem e o checksum gravado ao lado, quando existem.
+    if not path.exists() or (size is not None and path.stat().st_size != size):
+        return False
+    checksum_path = _checksum_path(path)
+    return not checksum_path.exists() or checksum_path.read_text().strip() == _sha256(path)
+
+
+def _fetch(url, tmp_path):
+    # Continua um download interrompido a partir do tamanho do .part, se o servidor aceitar Range
+    offset = tmp_path.stat().st_size if tmp_path.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with _session().get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 416:  # O .part já está completo
+            return
+        response.raise_for_status()
+        mode = "ab" if response.status_code == 206 else "wb"
+        with open(tmp_path, mode) as file:
+            for block in response.iter_content(BLOCK_SIZE):
+                file.write(block)
+
+
+def download_file(sheet_id, base_url=BASE_URL, zip_folder=ZIP_FOLDER, retries=RETRIES, backoff=BACKOFF):
+    """
+    Download one Topodata ZIP to disk, resuming partial downloads and retrying on failure.
+
+    Files already downloaded are skipped when their size still matches the source and
+    their content still matches the checksum saved next to them.
+
+    Args:
+        sheet_id (str): Name of the ZIP file, e.g. ``"23_465txt.zip"``.
+        base_url (str): HTTP URL, ``file://`` URL or folder with the ZIP files.
+        zip_folder (str | Path): Folder where the ZIP files are kept.
+        retries (int): Number of attempts before giving up.
+        backoff (float): Wait before the second attempt, doubled after each failure.
+
+    Returns:
+        Path: Path to the downloaded ZIP file.
+    """
+    zip_folder = Path(zip_folder)
+    os.makedirs(zip_folder, exist_ok=True)
+    path = zip_folder / sheet_id
+    tmp_path = path.with_name(path.name + ".part")
+
+    folder = _local_folder(base_url)
+    if folder is not None:
+        source = folder / sheet_id
+        if not _is_complete(path, source.stat().st_size):
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, path)
+            _checksum_path(path).write_text(_sha256(path))
+        return path
+
+    url = f"{base_url.rstrip('/')}/{sheet_id}"
+    for attempt in range(retries):
+        try:
+            if _is_complete(path, _remote_size(url)):
+                return path
+            _fetch(url, tmp_path)
+            os.replace(tmp_path, path)
+            _checksum_path(path).write_text(_sha256(path))
+            return path
+        except requests.RequestException as error:
+            # Erros do cliente (404, 403...) não melhoram com uma nova tentativa
+            response = getattr(error, "response", None)
+            client_error = response is not None and 400 <= response.status_code < 500
+            if client_error or attempt == retries - 1:
+                raise
+            wait = backoff * 2 ** attempt
+            print(f"Falha ao baixar {url} ({error}), tentando novamente em {wait:.0f}s")
+            time.sleep(wait)
+
+
 # função para baixar e extrair o arquivo ZIP
-def download_and_extract_zip(url, extract_to=ELEVATION_FOLDER):
-    # Enviar uma solicitação HTTP GET para a URL
-    response = requests.get(url)
-    # Verifica se a solicitação foi bem-sucedida
-    if response.status_code == 200:
-        # Abrir o ZIP recebido na memória
-        with zipfile.ZipFile(BytesIO(response.content)) as thezip:
-            # Extrair o conteúdo do objeto ZIP para o diretório desejado
-            thezip.extractall(path=extract_to)
-            # Retorna a lista dos nomes dos arquivos extraídos
-            return thezip.namelist()
-    else:
-        raise Exception(f"Erro ao baixar o arquivo: status code {response.status_code}")
-
-def download_all():
-    id_list = download_id_list()
-    for id_ in tqdm(id_list, desc="Downloading files"):
-        url = BASE_URL.format(sheet_id=id_)
-        download_and_extract_zip(url)
-
-def concat_all_files():
-    file_list = [ELEVATION_FOLDER.joinpath(name) for name in os.listdir(ELEVATION_FOLDER)]
-    df_list = []
-    for file in tqdm(file_list, desc="Listing files"):
-        df = pd.read_csv(file, sep="\s+")
-        print("File:", file, "- Shape:", df.shape)
-        df.columns = ["lat", "lon", "elevation"]
-        for col in df.columns:
-            df[col] = df[col].astype(float)
-        df_list.append(df)
-    coords_df = pd.concat(df_list, axis=0)
-    print("Coords shape:", coords_df.shape)
-    print(coords_df.head(5))
-    coords_df.to_csv("data/saopaulo_state_elevation.csv", index=False)
+def download_and_extract_zip(sheet_id, extract_to=ELEVATION_FOLDER, base_url=BASE_URL, zip_folder=ZIP_FOLDER):
+    path = download_file(sheet_id, base_url, zip_folder)
+    with zipfile.ZipFile(path) as thezip:
+        # Extrai apenas os arquivos que ainda não existem com o tamanho certo
+        for member in thezip.infolist():
+            target = Path(extract_to) / member.filename
+            if not target.exists() or target.stat().st_size != member.file_size:
+                thezip.extract(member, path=extract_to)
+        # Retorna a lista dos nomes dos arquivos extraídos
+        return thezip.namelist()
+
+
+def download_and_convert_zip(sheet_id, folder=ELEVATION_FOLDER, base_url=BASE_URL, zip_folder=ZIP_FOLDER):
+    # O TXT é lido de dentro do ZIP e gravado direto como folha binária, sem passar pelo disco
+    path = download_file(sheet_id, base_url, zip_folder)
+    return [tile.name for tile in convert_zip(path, folder)]
+
+
+def download_all(id_list=None, base_url=BASE_URL, extract_to=ELEVATION_FOLDER, zip_folder=ZIP_FOLDER,
+                 max_workers=MAX_WORKERS, extract_txt=False):
+    """
+    Download Topodata tiles in parallel and convert them to binary tiles.
+
+    A failed tile does not stop the others; the failures are reported at the end.
+
+    Args:
+        id_list (list): ZIP files to download. Defaults to every file listed at ``base_url``.
+        base_url (str): HTTP URL, ``file://`` URL or folder with the ZIP files.
+        extract_to (str | Path): Folder where the tiles are written.
+        zip_folder (str | Path): Folder where the ZIP files are kept.
+        max_workers (int): Number of simultaneous downloads.
+        extract_txt (bool): Extract the TXT files instead of converting them to ``.tile``.
+
+    Returns:
+        dict: Names of the written files for each ZIP that succeeded.
+    """
+    if id_list is None:
+        id_list = download_id_list(base_url)
+
+    worker = download_and_extract_zip if extract_txt else download_and_convert_zip
+    results, failures = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(worker, id_, extract_to, base_url, zip_folder): id_
+                   for id_ in id_list}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading files"):
+            id_ = futures[future]
+            try:
+                results[id_] = future.result()
+            except Exception as error:
+                failures[id_] = error
+
+    for id_, error in failures.items():
+        print(f"Erro ao baixar {id_}: {error}")
+    return results
 
 def download_polygon_wkt(osmid):
     """
@@ -78,6 +239,6 @@ def download_polygon_wkt(osmid):
         return f"Error: Unable to download polygon for OSM ID {osmid}. HTTP Status: {response.status_code}"
 
 if __name__ == "__main__":
-    download_all()
-    # concat_all_files()
+    # Uso: python -m src.download [URL ou pasta do espelho]
+    download_all(base_url=sys.argv[1] if len(sys.argv) > 1 else BASE_URL)
     
\ No newline at end of file
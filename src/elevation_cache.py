@@ -0,0 +1,169 @@
+from pathlib import Path
+from src.stage_cache import stage_key
+import numpy as np
+import os
+
+CACHE_FOLDER = Path("data/cache")
+# Passo de quantização das coordenadas, em graus (~0,1 m): pontos mais próximos que isso dividem a entrada
+QUANTUM = 1e-6
+MAX_ENTRIES = 50_000_000  # ~16 bytes por entrada
+
+
+def cache_path(method, *identity, folder=CACHE_FOLDER):
+    """
+    Return the cache file for the elevations of an estimation method over a set of tiles.
+
+    Args:
+        method (str): Estimation method, one of ``METHODS``.
+        *identity: Everything else the cached values depend on, e.g. the estimator's
+            ``k``, whether a mosaic is used and the tile fingerprints (see ``tile_fingerprints``).
+        folder (str | Path): Folder of the cache files.
+
+    Returns:
+        Path: Path to the ``.npz`` cache file.
+    """
+    return Path(folder) / f"elevation_{method}_{stage_key(method, *identity)[:16]}.npz"
+
+
+class ElevationCache:
+    """
+    Persistent cache of estimated elevations, keyed by quantized coordinates.
+
+    The entries are kept as three sorted arrays (uint64 key, float32 elevation and
+    the generation in which the entry was last used) and saved as an ``.npz`` file.
+    Each time the cache is opened a new generation starts; when the cache grows past
+    ``max_entries`` the entries from the oldest generations are dropped first.
+
+    The cached values depend on the tiles and on the estimation method, so the file
+    name carries them (see ``cache_path``): changing a tile moves its regions to a new
+    file. Several processes may share a file; ``save`` merges the entries saved by the
+    others since the cache was opened.
+
+    Args:
+        path (str | Path): Path to the ``.npz`` file. It is created on the first ``save``.
+        max_entries (int): Maximum number of entries kept on disk.
+        quantum (float): Quantization step of the coordinates, in degrees.
+        reset (bool): Start empty, ignoring the entries on disk; ``save`` then replaces them.
+    """
+    def __init__(self, path, max_entries=MAX_ENTRIES, quantum=QUANTUM, reset=False):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.quantum = quantum
+        self.hits = 0
+        self.misses = 0
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.values = np.empty(0, dtype=np.float32)
+        self.generations = np.empty(0, dtype=np.uint32)
+        self.generation = 0
+        # Versão do arquivo vista na abertura: se mudar até o save, outro processo salvou no meio tempo
+        self.stamp = self._stamp(self.path)
+        if self.stamp is not None and not reset:
+            with np.load(self.path) as data:
+                self.keys = data["keys"]
+                self.values = data["values"]
+                self.generations = data["generations"]
+                self.generation = int(data["generation"]) + 1
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _keys(self, lats, lons):
+        # 32 bits para cada coordenada: 360° / QUANTUM cabe com folga em um uint32
+        lat_bits = np.rint((np.asarray(lats, dtype=np.float64) + 180) / self.quantum).astype(np.uint64)
+        lon_bits = np.rint((np.asarray(lons, dtype=np.float64) + 180) / self.quantum).astype(np.uint64)
+        return (lat_bits << np.uint64(32)) | lon_bits
+
+    def lookup(self, lats, lons):
+        """
+        Look up many points at once.
+
+        Args:
+            lats (array-like): Latitudes of the points.
+            lons (array-like): Longitudes of the points.
+
+        Returns:
+            tuple: The elevations (NaN for misses) and the boolean mask of the points found.
+        """
+        keys = self._keys(lats, lons)
+        positions = np.searchsorted(self.keys, keys)
+        positions = np.minimum(positions, max(len(self.keys) - 1, 0))
+        found = (self.keys[positions] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+
+        values = np.full(len(keys), np.nan)
+        values[found] = self.values[positions[found]]
+        self.generations[positions[found]] = self.generation
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+        return values, found
+
+    @staticmethod
+    def _stamp(path):
+        if not path.exists():
+            return None
+        stat = path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def _merge(self, keys, values, generations, replace=True):
+        # Junta entradas já ordenadas e sem chaves repetidas às do cache, sem reordenar o cache inteiro
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        if replace:
+            self.values[positions[found]] = values[found]
+            self.generations[positions[found]] = generations[found]
+        new = ~found
+        self.keys = np.insert(self.keys, positions[new], keys[new])
+        self.values = np.insert(self.values, positions[new], values[new])
+        self.generations = np.insert(self.generations, positions[new], generations[new])
+
+    def insert(self, lats, lons, values):
+        """
+        Add or replace the elevation of many points at once.
+
+        Args:
+            lats (array-like): Latitudes of the points.
+            lons (array-like): Longitudes of the points.
+            values (array-like): Elevations of the points.
+        """
+        keys = self._keys(lats, lons)
+        order = np.argsort(keys, kind='stable')
+        keys, values = keys[order], np.asarray(values, dtype=np.float32)[order]
+        # Pontos repetidos na mesma chamada: fica o último valor
+        last = np.r_[keys[1:] != keys[:-1], True]
+        keys, values = keys[last], values[last]
+        self._merge(keys, values, np.full(len(keys), self.generation, dtype=np.uint32))
+
+    def _evict(self):
+        if len(self.keys) <= self.max_entries:
+            return
+        # Mantém as entradas usadas mais recentemente e volta a ordenar pela chave
+        keep = np.sort(np.argsort(self.generations, kind='stable')[len(self.keys) - self.max_entries:])
+        self.keys, self.values, self.generations = self.keys[keep], self.values[keep], self.generations[keep]
+
+    def save(self, path=None):
+        """
+        Write the cache to disk, evicting the oldest entries beyond ``max_entries``.
+
+        When the file was saved by another process since this cache was opened, its
+        entries are merged first; for the points present in both, the values of this
+        cache are kept.
+
+        Args:
+            path (str | Path): Output path. Defaults to the path the cache was opened from.
+        """
+        path = Path(path) if path is not None else self.path
+        stamp = self._stamp(path)
+        if stamp is not None and (path != self.path or stamp != self.stamp):
+            with np.load(path) as data:
+                self._merge(data["keys"], data["values"], data["generations"], replace=False)
+                self.generation = max(self.generation, int(data["generation"]))
+        self._evict()
+        os.makedirs(path.parent, exist_ok=True)
+        # Grava em um arquivo temporário e renomeia, para nunca deixar um cache pela metade
+        tmp_path = path.with_name(path.name + ".part")
+        with open(tmp_path, "wb") as file:
+            np.savez(file, keys=self.keys, values=self.values, generations=self.generations,
+                     generation=np.uint32(self.generation))
+        os.replace(tmp_path, path)
+        if path == self.path:
+            self.stamp = self._stamp(path)
@@ -0,0 +1,75 @@
+from src.tile_catalog import TileCatalog
+from src.tile_store import ELEVATION_FOLDER, convert_all, open_tile, read_txt, tile_is_current, tile_path
+import numpy as np
+import pandas as pd
+
+
+def build_elevation_dataset(folder=ELEVATION_FOLDER, overwrite=False):
+    """
+    Build the elevation dataset from the TXT tiles in a folder.
+
+    The dataset is partitioned by sheet: each tile becomes one ``.tile`` file
+    (float32 grid, converted one at a time in chunks) and the catalog records the
+    extent of every partition, so readers only open the ones they need.
+
+    Args:
+        folder (str | Path): Folder with the ``*cor_rec.txt`` tiles.
+        overwrite (bool): Convert again tiles that already have a binary version.
+
+    Returns:
+        TileCatalog: Catalog of the partitions.
+    """
+    convert_all(folder, overwrite)
+    return TileCatalog.scan(folder)
+
+
+def _axis_range(value_min, value_max, origin, step, size):
+    # Índices da grade que caem dentro de [value_min, value_max]
+    start = max(int(np.ceil((value_min - origin) / step - 1e-9)), 0)
+    stop = min(int(np.floor((value_max - origin) / step + 1e-9)) + 1, size)
+    return start, stop
+
+
+def read_elevation_dataset(bounds, base_path=ELEVATION_FOLDER, catalog=None):
+    """
+    Read the elevation samples inside a bounding box.
+
+    Only the partitions that intersect the box are opened, and only the part of
+    each one inside the box is read from its memory map. Tiles without an
+    up-to-date ``.tile`` are read from their TXT.
+
+    Args:
+        bounds (tuple): ``(lat_min, lon_min, lat_max, lon_max)``, as returned by ``polygon.bounds``.
+        base_path (str | Path): Folder of the dataset.
+        catalog (TileCatalog): Catalog of the partitions. Scanned from ``base_path`` if not given.
+
+    Returns:
+        pd.DataFrame: lat, lon and elevation (float32) of every sample with data inside the box.
+    """
+    catalog = catalog if catalog is not None else TileCatalog.scan(base_path)
+    lat_min, lon_min, lat_max, lon_max = bounds
+
+    frames = []
+    for tile_id in catalog.tiles_for_bbox(bounds):
+        filepath = catalog.paths[tile_id]
+        # Sem folha binária, ou com uma mais antiga que o TXT, lê o TXT (como o estimador)
+        if tile_is_current(filepath):
+            header, grid = open_tile(tile_path(filepath))
+        else:
+            header, grid = read_txt(filepath)
+        c_start, c_stop = _axis_range(lat_min, lat_max, header["lat0"], header["dlat"], header["cols"])
+        r_start, r_stop = _axis_range(lon_min, lon_max, header["lon0"], header["dlon"], header["rows"])
+        if c_start >= c_stop or r_start >= r_stop:
+            continue
+
+        window = np.asarray(grid[r_start:r_stop, c_start:c_stop])
+        rows, cols = np.nonzero(~np.isnan(window))
+        frames.append(pd.DataFrame({
+            "lat": (header["lat0"] + (cols + c_start) * header["dlat"]).astype(np.float32),
+            "lon": (header["lon0"] + (rows + r_start) * header["dlon"]).astype(np.float32),
+            "elevation": window[rows, cols],
+        }))
+
+    if not frames:
+        return pd.DataFrame({column: np.array([], dtype=np.float32) for column in ("lat", "lon", "elevation")})
+    return pd.concat(frames, ignore_index=True)
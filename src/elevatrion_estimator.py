@@ -1,90 +1,346 @@
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 from sklearn.neighbors import BallTree
+from src.mosaic import MOSAIC_FOLDER, build_mosaic
+from src.tile_catalog import TileCatalog
+from src.tile_store import open_tile, read_header, read_txt, tile_is_current, tile_path
 import numpy as np
 import pandas as pd
 
 BASE_PATH = Path("data/elevation")
 
-def get_file_path(lat, lon):
-
-    lon_str = str(int(abs(lon)))
-
-    int_lat = 10 * lat
-    round_lat = int_lat - (int_lat % 15)
-    lat_str = str(int(abs(round_lat)))
-
-    if lat_str.endswith("0"):
-        lat_str = lat_str[:-1] + "_"
-    
-    file_name = f"{lon_str:02d}_{lat_str}cor_rec.txt"
-    
-    # Exceptions (check at http://www.dsr.inpe.br/topodata/acesso.php)
-    exception_map = {"24_465cor_rec.txt": "23_465cor_rec.txt",
-                     "25_48_cor_rec.txt": "24_48_cor_rec.txt",
-                     "24_45_cor_rec.txt": "23_45_cor_rec.txt",
-                     "34_54_cor_rec.txt": "33_54_cor_rec.txt",
-                     "33_525cor_rec.txt": "32_525cor_rec.txt",
-                     "32_51_cor_rec.txt": "31_51_cor_rec.txt",
-                     "30_495cor_rec.txt": "29_495cor_rec.txt",
-                     
-                     "23_42_cor_rec.txt": "22_42_cor_rec.txt",
-                     "21_405cor_rec.txt": "20_405cor_rec.txt",
-                     "17_39_cor_rec.txt": "16_39_cor_rec.txt",
-                     "12_375cor_rec.txt": "11_375cor_rec.txt",
-                     "10_36_cor_rec.txt": "09_36_cor_rec.txt",
-                     }
-    file_name = exception_map.get(file_name, file_name)
-
-    file_path = BASE_PATH / file_name
-
-    if not file_path.exists():
-        raise ValueError(f"Arquivo {file_name} não encontrado.")
-    
-    
-    return file_path
+METHODS = ('knn', 'bilinear', 'bicubic')
+MAX_TILES = 4  # Folhas mantidas em memória ao mesmo tempo
+
+class KnnTile:
+    """
+    Uma folha de elevação carregada em memória, pronta para consultas KNN.
+    """
+    def __init__(self, filepath, coords, elevations):
+        self.filepath = filepath
+        self.lat_min, self.lon_min = coords.min(axis=0)
+        self.lat_max, self.lon_max = coords.max(axis=0)
+        self.elevations = elevations
+
+        # Construir a BallTree
+        self.tree = BallTree(np.deg2rad(coords), metric='haversine')
+        self.nbytes = sum(array.nbytes for array in self.tree.get_arrays())
+        if not isinstance(self.elevations, np.memmap):
+            self.nbytes += self.elevations.nbytes
+
+    @classmethod
+    def from_file(cls, filepath, method='knn'):
+        # Uma folha binária mais antiga que o TXT está desatualizada: lê o TXT
+        if tile_is_current(filepath):
+            return cls.from_tile(filepath)
+
+        # Carrega os dados do arquivo CSV
+        df = pd.read_csv(filepath, sep=r"\s+", names=["lat", "lon", "elevation"])
+        return cls(filepath, df[['lat', 'lon']].values, df['elevation'].values)
+
+    @classmethod
+    def from_tile(cls, filepath):
+        # Abre a versão binária da folha (ver src/tile_store.py) sem copiar as elevações
+        header, grid = open_tile(tile_path(filepath))
+        return cls.from_grid(filepath, header, grid)
+
+    @classmethod
+    def from_grid(cls, filepath, header, grid):
+        valid = ~np.isnan(grid)
+        rows, cols = np.nonzero(valid)
+        coords = np.column_stack([header['lat0'] + cols * header['dlat'], header['lon0'] + rows * header['dlon']])
+        elevations = grid.reshape(-1) if valid.all() else grid[valid]
+        return cls(filepath, coords, elevations)
+
+    def contains(self, lat, lon):
+        return self.lat_min <= lat <= self.lat_max and self.lon_min <= lon <= self.lon_max
+
+    def estimate(self, lats, lons, k):
+        dist, indices = self.tree.query(np.deg2rad(np.column_stack([lats, lons])), k=k)
+        weights = 1 / np.maximum(dist, 1e-7)  # Evitar divisão por zero
+        return (self.elevations[indices] * weights).sum(axis=1) / weights.sum(axis=1)
+
+
+def _cubic_weights(t):
+    # Núcleo de convolução cúbica de Keys (a = -0.5) para os 4 vizinhos de cada ponto
+    t = t[:, None] - np.arange(-1, 3)
+    t = np.abs(t)
+    return np.where(t <= 1, (1.5 * t - 2.5) * t * t + 1,
+                    np.where(t < 2, ((-0.5 * t + 2.5) * t - 4) * t + 2, 0))
+
+
+class RasterTile:
+    """
+    Uma folha de elevação tratada como grade regular: guarda apenas a matriz de
+    elevações, sua origem e espaçamento, e interpola por aritmética de índices.
+    """
+    def __init__(self, filepath, header, grid, method='bilinear'):
+        self.filepath = filepath
+        self.header = header
+        self.grid = grid
+        self.method = method
+        self.lat_min = header['lat0']
+        self.lon_min = header['lon0']
+        self.lat_max = header['lat0'] + (header['cols'] - 1) * header['dlat']
+        self.lon_max = header['lon0'] + (header['rows'] - 1) * header['dlon']
+        self.nbytes = 0 if isinstance(grid, np.memmap) else grid.nbytes
+
+    @classmethod
+    def from_file(cls, filepath, method='bilinear'):
+        if tile_is_current(filepath):
+            header, grid = open_tile(tile_path(filepath))
+        else:
+            header, grid = read_txt(filepath)
+        return cls(filepath, header, grid, method)
+
+    def contains(self, lat, lon):
+        return self.lat_min <= lat <= self.lat_max and self.lon_min <= lon <= self.lon_max
+
+    def _grid_position(self, lats, lons):
+        rows, cols = self.grid.shape
+        x = np.clip((np.asarray(lats) - self.header['lat0']) / self.header['dlat'], 0, cols - 1)
+        y = np.clip((np.asarray(lons) - self.header['lon0']) / self.header['dlon'], 0, rows - 1)
+        c0 = np.minimum(np.floor(x).astype(np.int64), max(cols - 2, 0))
+        r0 = np.minimum(np.floor(y).astype(np.int64), max(rows - 2, 0))
+        return r0, c0, y - r0, x - c0
+
+    def _bilinear(self, r0, c0, ty, tx):
+        rows, cols = self.grid.shape
+        r1 = np.minimum(r0 + 1, rows - 1)
+        c1 = np.minimum(c0 + 1, cols - 1)
+        values = np.stack([self.grid[r0, c0], self.grid[r0, c1], self.grid[r1, c0], self.grid[r1, c1]], axis=1).astype(np.float64)
+        weights = np.stack([(1 - ty) * (1 - tx), (1 - ty) * tx, ty * (1 - tx), ty * tx], axis=1)
+
+        # Cantos sem dado são ignorados e os pesos dos demais renormalizados
+        valid = ~np.isnan(values)
+        weights = weights * valid
+        total = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (np.where(valid, values, 0) * weights).sum(axis=1) / total
+
+    def _bicubic(self, r0, c0, ty, tx):
+        rows, cols = self.grid.shape
+        r_idx = np.clip(r0[:, None] + np.arange(-1, 3), 0, rows - 1)
+        c_idx = np.clip(c0[:, None] + np.arange(-1, 3), 0, cols - 1)
+        values = self.grid[r_idx[:, :, None], c_idx[:, None, :]].astype(np.float64)
+        elevations = np.einsum('ni,nij,nj->n', _cubic_weights(ty), values, _cubic_weights(tx))
+
+        # Onde falta algum vizinho, recorre à interpolação bilinear
+        missing = np.isnan(elevations)
+        if missing.any():
+            elevations[missing] = self._bilinear(r0[missing], c0[missing], ty[missing], tx[missing])
+        return elevations
+
+    def estimate(self, lats, lons, k=None):
+        r0, c0, ty, tx = self._grid_position(lats, lons)
+        if self.method == 'bicubic':
+            return self._bicubic(r0, c0, ty, tx)
+        return self._bilinear(r0, c0, ty, tx)
+
 
 class GeoElevationEstimator:
-    def __init__(self):
-        self.lat_min = 0
-        self.lat_max = 0
-        self.lon_min = 0
-        self.lon_max = 0
-        self.tree = None  # Será inicializado após carregar e filtrar os dados
-        self.elevations = None  # Também será inicializado apropriadamente
+    """
+    Estimate elevations from the INPE tiles, keeping the most recently used
+    tiles in memory.
+
+    Args:
+        method (str): Interpolation engine: ``'knn'`` (inverse-distance weighting of
+            the k nearest samples, using a BallTree), ``'bilinear'`` or ``'bicubic'``
+            (index arithmetic over the regular tile grid).
+        base_path (str | Path): Folder with the elevation tiles. Ignored when a catalog is given.
+        catalog (TileCatalog): Tile catalog used to find the tile of each point.
+        max_tiles (int): Maximum number of tiles kept in memory.
+        max_bytes (int): Memory budget for the resident tiles, in bytes. The most
+            recently used tile is always kept, even if it alone exceeds the budget.
+        cache (ElevationCache): Persistent cache of estimated elevations. When given,
+            ``estimate_elevations`` only estimates the points missing from it, and all
+            its results are rounded to float32, the precision stored in the cache.
+    """
+    def __init__(self, method='knn', base_path=BASE_PATH, catalog=None, max_tiles=MAX_TILES, max_bytes=4 * 1024 ** 3,
+                 cache=None):
+        if method not in METHODS:
+            raise ValueError(f"Método {method} desconhecido. Use um de {METHODS}.")
+        self.method = method
+        self.catalog = catalog if catalog is not None else TileCatalog.scan(base_path)
         self.k = 3  # Número de vizinhos para o KNN
+        self.cache = cache
+        self.sheets = None  # Catálogo das folhas enquanto um mosaico está em uso (ver use_mosaic)
+        self.max_tiles = max_tiles
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()  # Folhas carregadas, da menos para a mais recente
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.queries = 0  # Pontos estimados (consultas ao KNN ou à grade)
+
+    @property
+    def nbytes(self):
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    def cache_info(self):
+        """
+        Return the tile cache counters.
+
+        Returns:
+            dict: Hits, misses, evictions, estimated points, resident tiles and bytes, and the limits.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'queries': self.queries,
+            'tiles': len(self.tiles),
+            'bytes': self.nbytes,
+            'max_tiles': self.max_tiles,
+            'max_bytes': self.max_bytes,
+        }
 
     def load(self, lat, lon):
+        tile_id = self.catalog.tiles_for_points([lat], [lon])[0]
+        if tile_id == -1:
+            raise ValueError(f"Nenhuma folha de elevação cobre o ponto ({lat}, {lon}).")
+        return self.get_tile(self.catalog.paths[tile_id])
+
+    def preload(self, bounds):
+        """
+        Load up front every tile that intersects a bounding box.
+
+        Args:
+            bounds (tuple): ``(lat_min, lon_min, lat_max, lon_max)``, as returned by ``polygon.bounds``.
+
+        Returns:
+            list: The paths of the intersecting tiles.
+        """
+        paths = [self.catalog.paths[tile_id] for tile_id in self.catalog.tiles_for_bbox(bounds)]
+        for filepath in paths:
+            self.get_tile(filepath)
+        return paths
 
-        print(f"Lat, Lon: {lat}, {lon}")
-        filepath = get_file_path(lat, lon)
+    def get_tile(self, filepath):
+        tile = self.tiles.get(filepath)
+        if tile is not None:
+            self.hits += 1
+            self.tiles.move_to_end(filepath)
+            return tile
+
+        self.misses += 1
         print(f"Carregando arquivo {filepath}")
+        tile_class = KnnTile if self.method == 'knn' else RasterTile
+        tile = tile_class.from_file(filepath, self.method)
+        self.tiles[filepath] = tile
+        self._evict()
+        return tile
 
-        # Carrega os dados do arquivo CSV
-        df = pd.read_csv(filepath, sep="\s+", names=["lat", "lon", "elevation"])
-
-        self.lat_min, self.lat_max = df['lat'].min(), df['lat'].max()
-        self.lon_min, self.lon_max = df['lon'].min(), df['lon'].max()
-                         
-        # Preparar os dados para o KNN
-        coords = df[['lat', 'lon']].values
-        self.elevations = df['elevation'].values
-        
-        # Construir a BallTree
-        self.tree = BallTree(np.deg2rad(coords), metric='haversine')
+    def _evict(self):
+        while len(self.tiles) > 1 and (len(self.tiles) > self.max_tiles or self.nbytes > self.max_bytes):
+            filepath, _ = self.tiles.popitem(last=False)
+            self.evictions += 1
+            print(f"Descarregando arquivo {filepath}")
+
+    def _find_tile(self, lat, lon):
+        # Procura primeiro nas folhas usadas mais recentemente
+        for filepath in reversed(self.tiles):
+            tile = self.tiles[filepath]
+            if tile.contains(lat, lon):
+                self.hits += 1
+                self.tiles.move_to_end(filepath)
+                return tile
+        return None
+
+    @contextmanager
+    def use_mosaic(self, bounds, folder=MOSAIC_FOLDER):
+        """
+        Answer the queries inside a region from a single mosaic of its tiles.
 
-    @staticmethod
-    def _weighted_elevation(neighbors, distances):
-        distances = np.maximum(distances, 1e-7)  # Evitar divisão por zero
-        weights = 1 / distances
-        return np.average(neighbors, weights=weights)
+        The mosaic removes the seams between Topodata sheets: neighbours and
+        interpolation stencils near a sheet border come from both sheets, and the
+        region needs a single tile load.
+
+        Only the queries made inside the ``with`` block use the mosaic; the catalog is
+        restored on exit, so an estimator shared by several regions is not affected.
+        Points that fall on a gap of the mosaic (no sheet covers them) are estimated
+        from the sheets, which raise the same error as without the mosaic.
+
+        Args:
+            bounds (tuple): ``(lat_min, lon_min, lat_max, lon_max)``, as returned by ``polygon.bounds``.
+            folder (str | Path): Folder where the mosaics are stored.
+
+        Yields:
+            Path: Path to the mosaic ``.tile`` file.
+        """
+        sheets = self.catalog
+        mosaic_path = build_mosaic(bounds, sheets, folder)
+        self.catalog = sheets.with_tiles([mosaic_path], [read_header(mosaic_path)])
+        self.sheets = sheets
+        try:
+            yield mosaic_path
+        finally:
+            self.catalog, self.sheets = sheets, None
+            self.tiles.pop(mosaic_path, None)
 
     def estimate_elevation(self, lat, lon):
-        if lat > self.lat_max or lat < self.lat_min or lon > self.lon_max or lon < self.lon_min:
-            self.load(lat, lon)
-            
-        dist, indices = self.tree.query(np.deg2rad([[lat, lon]]), k=self.k)
-        neighbor_elevations = self.elevations[indices[0]]
-        return self._weighted_elevation(neighbor_elevations, dist[0])
+        tile = self._find_tile(lat, lon)
+        if tile is None:
+            tile = self.load(lat, lon)
+        self.queries += 1
+        return tile.estimate([lat], [lon], self.k)[0]
+
+    def estimate_elevations(self, lats, lons):
+        """
+        Estimate the elevation of many points at once.
+
+        Points are grouped by source tile using the tile catalog, so each tile
+        is loaded once and answered with a single vectorized query. With a cache,
+        only the points not found in it are estimated, and they are added to it.
+
+        Args:
+            lats (array-like): Latitudes of the points.
+            lons (array-like): Longitudes of the points.
+
+        Returns:
+            np.ndarray: Estimated elevations, in the same order as the input.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        if self.cache is None:
+            return self._estimate_elevations(lats, lons)
+
+        elevations, found = self.cache.lookup(lats, lons)
+        missing = np.flatnonzero(~found)
+        if len(missing):
+            elevations[missing] = self._estimate_elevations(lats[missing], lons[missing]).astype(np.float32)
+            self.cache.insert(lats[missing], lons[missing], elevations[missing])
+        return elevations
+
+    def _estimate_elevations(self, lats, lons):
+        elevations = self._estimate_from(self.catalog, lats, lons)
+        if self.sheets is not None:
+            # Buracos do mosaico (células sem nenhuma folha) voltam para as folhas, como sem o mosaico
+            gaps = np.flatnonzero(np.isnan(elevations))
+            if len(gaps):
+                elevations[gaps] = self._estimate_from(self.sheets, lats[gaps], lons[gaps])
+        return elevations
+
+    def _estimate_from(self, catalog, lats, lons):
+        elevations = np.empty(len(lats))
+        if len(lats) == 0:
+            return elevations
+
+        tile_ids = catalog.tiles_for_points(lats, lons)
+        if (tile_ids == -1).any():
+            missing = np.flatnonzero(tile_ids == -1)
+            raise ValueError(f"Nenhuma folha de elevação cobre {len(missing)} pontos, "
+                             f"por exemplo ({lats[missing[0]]}, {lons[missing[0]]}).")
+
+        # Agrupa os pontos por folha: cada folha é carregada e consultada uma única vez
+        order = np.argsort(tile_ids, kind='stable')
+        groups = np.split(order, np.flatnonzero(np.diff(tile_ids[order])) + 1)
+        for idx in groups:
+            tile = self.get_tile(catalog.paths[tile_ids[idx[0]]])
+            elevations[idx] = tile.estimate(lats[idx], lons[idx], self.k)
+        self.queries += len(lats)
+        return elevations
 
 if __name__ == '__main__':
     # Uso da classe GeoElevationEstimator
@@ -96,8 +352,6 @@ if __name__ == '__main__':
     print(f'Estimated Elevation: {estimated_elev}')
 
 
-    # file = get_file_path(-55.4958,     -31.3091)
-    # df = pd.read_csv(file, sep="\s+", names=["lat", "lon", "elevation"])
-    # lat_min, lat_max = df['lat'].min(), df['lat'].max()
-    # lon_min, lon_max = df['lon'].min(), df['lon'].max()
-    # print(df.head(5))
\ No newline at end of file
+    # catalog = TileCatalog.scan()
+    # tile_id = catalog.tiles_for_points([-55.4958], [-31.3091])[0]
+    # print(catalog.paths[tile_id], catalog.extents[tile_id])
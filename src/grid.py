@@ -1,8 +1,110 @@
-from shapely.geometry import MultiPolygon, Polygon
 from src.visualization import plot_and_save_geometry
 from src.input_output import save_multipolygon
+from src.mesh import TriangleMesh
+import numpy as np
+import shapely
 
-def generate_triangle_mesh(x_min=0, y_min=0, x_max=20, y_max=20, triangle_base=1):
+def _accumulate(start, step, limit):
+    # Reproduz a soma acumulada dos laços originais (start, start + step, ...) e
+    # retorna os valores junto com o índice do primeiro em que valor + step > limit
+    count = max(int((limit - start) / step), 0) + 3
+    values = np.add.accumulate(np.concatenate([[start], np.full(count, step)]))
+    return values, int(np.flatnonzero(values + step > limit)[0])
+
+
+def _lattice_faces(rows, positions, n_positions):
+    """
+    Vértices de cada triângulo da treliça, dados a linha e a posição do triângulo na linha.
+
+    Em cada linha há n_positions triângulos alternando entre apontar para cima e para baixo:
+    o primeiro e o último são meios triângulos que fecham a borda. As linhas ímpares começam
+    com a orientação invertida.
+    """
+    n_columns = n_positions  # colunas de vértices: 0 .. K + 1
+    up = (rows % 2 == 1) ^ ((positions - 1) % 2 == 1)
+    columns = np.stack([np.maximum(positions - 1, 0), positions, np.minimum(positions + 1, n_columns - 1)], axis=1)
+    levels = np.where(up[:, None], [0, 1, 0], [1, 0, 1])
+    return (rows[:, None] + levels) * n_columns + columns
+
+
+def _footprint_triangles(region, xs, ys, n_rows, n_positions, block_size):
+    # Classificação grosseira: blocos de block_size x block_size triângulos são testados de uma vez
+    r0, p0 = np.meshgrid(np.arange(0, n_rows, block_size), np.arange(0, n_positions, block_size), indexing='ij')
+    r0, p0 = r0.ravel(), p0.ravel()
+    r1, p1 = np.minimum(r0 + block_size, n_rows), np.minimum(p0 + block_size, n_positions)
+    boxes = shapely.box(xs[np.maximum(p0 - 1, 0)], ys[r0], xs[np.minimum(p1, n_positions - 1)], ys[r1])
+    inside = shapely.contains(region, boxes)
+    partial = shapely.intersects(region, boxes) & ~inside
+
+    local_rows, local_positions = np.divmod(np.arange(block_size * block_size), block_size)
+
+    def block_triangles(mask):
+        rows = r0[mask][:, None] + local_rows
+        positions = p0[mask][:, None] + local_positions
+        valid = (rows < r1[mask][:, None]) & (positions < p1[mask][:, None])
+        return rows[valid], positions[valid]
+
+    # Blocos totalmente dentro entram inteiros; só os da borda têm os vértices testados um a um
+    rows, positions = block_triangles(inside)
+    edge_rows, edge_positions = block_triangles(partial)
+    edge_faces = _lattice_faces(edge_rows, edge_positions, n_positions)
+    vertex_ids, inverse = np.unique(edge_faces, return_inverse=True)
+    vertex_rows, vertex_columns = np.divmod(vertex_ids, n_positions)
+    vertex_inside = shapely.contains_xy(region, xs[vertex_columns], ys[vertex_rows])
+    keep = vertex_inside[inverse.reshape(-1, 3)].all(axis=1)
+
+    # Mantém a mesma ordem (linha a linha) da treliça completa
+    triangle_ids = np.sort(np.concatenate([rows * n_positions + positions,
+                                           edge_rows[keep] * n_positions + edge_positions[keep]]))
+    return np.divmod(triangle_ids, n_positions)
+
+
+def lattice_extent(x_min=0, y_min=0, x_max=20, y_max=20, triangle_base=1):
+    """
+    Return the rectangle actually covered by ``generate_triangle_lattice`` without a boundary.
+
+    The last row and the closing half triangles may stop short of or pass the
+    requested domain, so the lattice covers its own rectangle.
+
+    Args:
+        x_min, y_min, x_max, y_max (float): Domain of the lattice.
+        triangle_base (float): Base of each triangle.
+
+    Returns:
+        tuple: ``(x_min, y_min, x_max, y_max)`` of the lattice vertices.
+    """
+    triangle_height = float(triangle_base) * (3. ** (1./3.)) / 2.
+    ys, n_rows = _accumulate(y_min, triangle_height, y_max)
+    xs, n_steps = _accumulate(x_min, triangle_base / 2, x_max)
+    return x_min, y_min, float(xs[n_steps + 1]), float(ys[n_rows])
+
+
+def generate_triangle_lattice(x_min=0, y_min=0, x_max=20, y_max=20, triangle_base=1, boundary=None, buffer=0.0,
+                              block_size=32):
+    """
+    Generate the triangular lattice as an indexed mesh.
+
+    Reproduces the alternating up/down triangle pattern of the original
+    ``generate_triangle_mesh`` loops, with the same rows, columns and vertex
+    order per triangle, built with array operations in time proportional to
+    the output size.
+
+    When a boundary is given, only the triangles whose three vertices fall inside
+    it (or inside it buffered by ``buffer``) are emitted. Blocks of triangles are
+    first classified as inside, outside or crossing the boundary, and only the
+    crossing blocks are tested vertex by vertex, so the cost follows the area of
+    the boundary rather than its bounding box.
+
+    Args:
+        x_min, y_min, x_max, y_max (float): Domain of the lattice.
+        triangle_base (float): Base of each triangle.
+        boundary (Polygon): Optional footprint, in the lattice coordinates.
+        buffer (float): Distance by which the footprint is grown before clipping.
+        block_size (int): Side, in triangles, of the blocks of the coarse test.
+
+    Returns:
+        TriangleMesh: The lattice, with shared vertices.
+    """
     # altura de um triângulo equilátero
     triangle_height = float(triangle_base) * (3. ** (1./3.)) / 2.
     # Verificações básicas para garantir que a base e altura são adequadas
@@ -11,54 +113,34 @@ def generate_triangle_mesh(x_min=0, y_min=0, x_max=20, y_max=20, triangle_base=1
     
     if x_max - x_min <= 0 or y_max - y_min <= 0:
         raise ValueError("Dimensões do espaço devem ser maiores que zero.")
-    
-    # Base horizontal do triângulo
+
     half_base = triangle_base / 2
-    mesh = []
-    
-    # Cria os triângulos em linhas alternadas
-    y = y_min
-
-    alternate_row = False  # Alternar a orientação do triângulo
-    while y + triangle_height <= y_max:
-        x = x_min
-        alternate_col = alternate_row  # Alternar a orientação do triângulo
-
-        if alternate_col:
-            # Triângulo apontando para cima
-            mesh.append(Polygon([(x, y + triangle_height), (x, y), (x + half_base, y + triangle_height)]))
-        else:
-            # Triângulo apontando para baixo
-            mesh.append(Polygon([(x, y), (x, y + triangle_height), (x + half_base, y)]))
-        
-        
-        while x + half_base <= x_max:
-            if alternate_col:
-                # Triângulo apontando para cima
-                mesh.append(Polygon([(x, y), (x + half_base, y + triangle_height), (x + triangle_base, y)]))
-            else:
-                # Triângulo apontando para baixo
-                mesh.append(Polygon([(x, y + triangle_height), (x + half_base, y), (x + triangle_base, y + triangle_height)]))
-
-            # Move para o próximo ponto no eixo x
-            x += half_base
-            alternate_col = not alternate_col
-        
-        # Último triângulo
-        if alternate_col:
-            # Triângulo apontando para cima
-            mesh.append(Polygon([(x, y), (x + half_base, y + triangle_height), (x + half_base, y)]))
-        else:
-            # Triângulo apontando para baixo
-            mesh.append(Polygon([(x, y + triangle_height), (x + half_base, y), (x + half_base, y + triangle_height)]))
-
-            
-        # Move para o próximo ponto no eixo y
-        y += triangle_height
-
-        alternate_row = not alternate_row
-    # Combina todos os polígonos em um MultiPolygon
-    mesh_shape = MultiPolygon(mesh)
+    ys, n_rows = _accumulate(y_min, triangle_height, y_max)
+    xs, n_steps = _accumulate(x_min, half_base, x_max)
+    if n_rows == 0:
+        return TriangleMesh(np.empty((0, 2)), np.empty((0, 3)))
+
+    # Cada linha tem o triângulo inicial, n_steps triângulos internos e o triângulo final
+    n_positions = n_steps + 2
+    xs, ys = xs[:n_positions], ys[:n_rows + 1]
+
+    if boundary is None:
+        rows, positions = np.divmod(np.arange(n_rows * n_positions), n_positions)
+    else:
+        region = boundary.buffer(buffer) if buffer else boundary
+        shapely.prepare(region)
+        rows, positions = _footprint_triangles(region, xs, ys, n_rows, n_positions, block_size)
+
+    # Em cada nível de vértices só metade das colunas é usada (a treliça é intercalada),
+    # então os vértices são criados apenas para os índices referenciados pelas faces
+    vertex_ids, faces = np.unique(_lattice_faces(rows, positions, n_positions), return_inverse=True)
+    vertex_rows, vertex_columns = np.divmod(vertex_ids, n_positions)
+    return TriangleMesh(np.column_stack([xs[vertex_columns], ys[vertex_rows]]), faces.reshape(-1, 3))
+
+
+def generate_triangle_mesh(x_min=0, y_min=0, x_max=20, y_max=20, triangle_base=1):
+    # Combina todos os triângulos em um MultiPolygon
+    mesh_shape = generate_triangle_lattice(x_min, y_min, x_max, y_max, triangle_base).to_multipolygon()
     return mesh_shape
 
 if __name__ == "__main__":
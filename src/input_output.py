@@ -1,6 +1,13 @@
 from pathlib import Path
 from shapely.geometry import Polygon, MultiPolygon, mapping, shape
+from src.elevation_cache import ElevationCache
+from src.mesh import TriangleMesh
+import numpy as np
 import json
+import os
+import shutil
+
+MESH_SUFFIX = ".mesh"
 
 def save_wkt(polygon_wkt, path):
     """
@@ -26,7 +33,10 @@ def load_wkt(path):
     with open(path, 'r') as f:
         return f.read()
     
+# Exportação em JSON, um dicionário GeoJSON por triângulo. O pipeline usa save_mesh/load_mesh
 def save_multipolygon(multipolygon, file_path):
+    if isinstance(multipolygon, TriangleMesh):
+        multipolygon = multipolygon.to_multipolygon()
     if not isinstance(multipolygon, MultiPolygon):
         raise ValueError('The input must be a shapely.geometry.MultiPolygon')
     
@@ -49,6 +59,74 @@ def load_multipolygon(file_path):
     multipolygon = MultiPolygon(triangles)
     return multipolygon
 
+def mesh_path(path):
+    """
+    Return the binary mesh path for a file path, with or without the ``.mesh`` suffix.
+    """
+    path = Path(path)
+    return path if path.suffix == MESH_SUFFIX else path.with_name(path.name + MESH_SUFFIX)
+
+def save_mesh(mesh, path, metadata=None):
+    """
+    Save a triangle mesh in the binary mesh format.
+
+    A ``.mesh`` is a folder with ``vertices.npy``, ``faces.npy`` and ``metadata.json``,
+    so the arrays can be memory-mapped back with ``np.load(mmap_mode='r')``.
+
+    Args:
+        mesh (TriangleMesh | MultiPolygon): The mesh to save.
+        path (str | Path): Output path. The ``.mesh`` suffix is added if missing.
+        metadata (dict): JSON-serializable information stored with the mesh, e.g. the grid step.
+
+    Returns:
+        Path: Path to the written ``.mesh`` folder.
+    """
+    if isinstance(mesh, MultiPolygon):
+        mesh = TriangleMesh.from_multipolygon(mesh)
+    path = mesh_path(path)
+
+    # Grava em uma pasta temporária e troca no final, para nunca deixar uma malha pela metade
+    tmp_path = path.with_name(path.name + ".part")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(tmp_path / "vertices.npy", mesh.vertices)
+    np.save(tmp_path / "faces.npy", mesh.faces)
+    with open(tmp_path / "metadata.json", 'w') as file:
+        json.dump(dict(metadata or {}, vertices=len(mesh.vertices), faces=len(mesh.faces)), file, indent=4)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+def load_mesh(path, mmap_mode='r'):
+    """
+    Load a triangle mesh saved with ``save_mesh``.
+
+    Args:
+        path (str | Path): Path to the ``.mesh`` folder (the suffix may be omitted).
+        mmap_mode (str | None): Passed to ``np.load``. The default maps the arrays read-only
+            instead of reading them; use ``None`` to load them into memory.
+
+    Returns:
+        TriangleMesh: The mesh.
+    """
+    path = mesh_path(path)
+    return TriangleMesh(np.load(path / "vertices.npy", mmap_mode=mmap_mode),
+                        np.load(path / "faces.npy", mmap_mode=mmap_mode))
+
+def load_mesh_metadata(path):
+    """
+    Read the metadata saved with a mesh.
+
+    Args:
+        path (str | Path): Path to the ``.mesh`` folder (the suffix may be omitted).
+
+    Returns:
+        dict: The metadata, including the vertex and face counts.
+    """
+    with open(mesh_path(path) / "metadata.json", 'r') as file:
+        return json.load(file)
+
 def save_polygon(polygon, file_path):
     if not isinstance(polygon, Polygon):
         raise ValueError('The input must be a shapely.geometry.Polygon')
@@ -75,22 +153,18 @@ def load_polygon(file_path):
 
 
 # Função para carregar cache de altitudes de um arquivo
-def load_cache(cache_file):
+def load_cache(cache_file, reset=False):
     """
     Load altitude cache from a file.
     
     Args:
-        cache_file (str): The file path to the cache file.
+        cache_file (str): The file path to the ``.npz`` cache file.
+        reset (bool): Ignore the saved entries; they are replaced when the cache is saved.
 
     Returns:
-        dict: A dictionary containing cached altitudes.
+        ElevationCache: The cache, empty if the file does not exist yet.
     """
-    if Path(cache_file).is_file():
-        with open(cache_file, 'r') as file:
-            cache = json.load(file)
-    else:
-        cache = {}
-    return cache
+    return ElevationCache(cache_file, reset=reset)
 
 # Função para salvar o cache de altitudes em um arquivo
 def save_cache(cache, cache_file):
@@ -98,8 +172,7 @@ def save_cache(cache, cache_file):
     Save altitude cache to a file.
     
     Args:
-        cache (dict): A dictionary containing altitudes to cache.
-        cache_file (str): The file path to save the cache file.
+        cache (ElevationCache): The altitude cache.
+        cache_file (str): The file path to save the ``.npz`` cache file.
     """
-    with open(cache_file, 'w') as file:
-        json.dump(cache, file, indent=4)
\ No newline at end of file
+    cache.save(cache_file)
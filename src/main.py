@@ -1,23 +1,36 @@
-from src.input_output import save_multipolygon, load_wkt, save_wkt
+from src.input_output import save_multipolygon, load_wkt, save_wkt, save_mesh, load_mesh, mesh_path, load_cache
 from src.visualization import plot_and_save_geometry
 
 from src.download import download_polygon_wkt
-from src.grid import generate_triangle_mesh
+from src.grid import generate_triangle_lattice, lattice_extent
 from src.transform import wkt_to_polygon, normalize_multipolygon, multipolygon_to_stl
-from src.surface import load_multipolygon, assign_z_coordinate, update_z_dimension
+from src.surface import assign_z_coordinate, update_z_dimension
+from src.adaptive import ADAPTIVE_LEVELS, refine_surface
+from src.decimate import decimate
+from src.elevatrion_estimator import GeoElevationEstimator
+from src.elevation_cache import cache_path
 
+from contextlib import nullcontext
 from pathlib import Path
 from src.poly_scaler import PolyScaler
+from src.profiling import PipelineProfiler
+from src.stage_cache import is_fresh, mark_fresh, stage_key, tile_fingerprints
 import os
+import shapely
+import sys
 
 
-def generate_city_stl_with_base(osmid, location_name, grid_step, include_bottom):
+def load_boundary(osmid, location_name):
+    """
+    Load the boundary polygon of a map, downloading it on the first call.
 
-    grid_spec = str(grid_step).replace(".", "")
-    bottom_spec = "with_bottom" if include_bottom else "without_bottom"
-    param_spec = f'{grid_spec}_{bottom_spec}'
-    grid_path = f'data/grids/grid_{param_spec}'
+    Args:
+        osmid (int): OpenStreetMap ID of the region (not used for custom maps that already have a WKT).
+        location_name (str): Name of the map folder in ``data/maps``.
 
+    Returns:
+        Polygon: The boundary.
+    """
     # Downloadin data (donwload_wkt.py)
     location_folder = Path(f'data/maps/{location_name}')
     if not location_folder.exists():
@@ -32,39 +45,180 @@ def generate_city_stl_with_base(osmid, location_name, grid_step, include_bottom)
     # Triangulation (transform.py)
     print("Carregando fronteira...")
     polygon_wkt = load_wkt(wkt_path)
-    polygon = wkt_to_polygon(polygon_wkt)
-    
-    plot_and_save_geometry(polygon, f'data/maps/{location_name}/poly_{param_spec}.png')
-
-    # Loading Grid (generate_grid.py)
-    if not Path(grid_path + '.png').exists():
-        print("Gerando mesh...")
-        grid = generate_triangle_mesh(triangle_base=grid_step)
-        # plot_and_save_geometry(grid, grid_path + '.png')
-        print("Salvando mesh...")
-        save_multipolygon(grid, grid_path + '.json')
-    else:
+    return wkt_to_polygon(polygon_wkt)
+
+
+def get_base_grid(grid_step):
+    """
+    Load the full triangle lattice used for maps with a bottom, generating it on the first call.
+
+    Args:
+        grid_step (float): Triangle base of the lattice.
+
+    Returns:
+        TriangleMesh: The lattice, memory-mapped from ``data/grids`` when it is already cached.
+    """
+    grid_path = f'data/grids/grid_{str(grid_step).replace(".", "")}_with_bottom'
+    if mesh_path(grid_path).exists():
         print("Carregando mesh...")
-        grid = load_multipolygon(grid_path + '.json')
-
-    # Surface (surface_From_grid.py)
-    print("Inicializando scaler...")
-    scaler = PolyScaler()
-    scaler.fit(polygon)
-    print("Aplicando scaler no grid...")
-    grid = scaler.inverse_transform(grid)
-    print("Adicionando terceira coordenada...")
-    polygon3d = assign_z_coordinate(polygon, grid, include_bottom)
-    save_multipolygon(polygon3d, f'data/maps/{location_name}/flat_surface_{param_spec}.json')
-    print("Estimando elevação...")
-    polygon3d = update_z_dimension(polygon3d)
-    save_multipolygon(polygon3d, f'data/maps/{location_name}/surface_{param_spec}.json')
+        return load_mesh(grid_path)
+
+    print("Gerando mesh...")
+    grid = generate_triangle_lattice(triangle_base=grid_step)
+    # plot_and_save_geometry(grid, grid_path + '.png')
+    print("Salvando mesh...")
+    save_mesh(grid, grid_path, {"grid_step": grid_step, "include_bottom": True})
+    return grid
+
+
+def generate_city_stl_with_base(osmid, location_name, grid_step, include_bottom, estimator=None, use_mosaic=False,
+                                 export_json=False, force=False, profile=False, adaptive_tolerance=None,
+                                 decimate_faces=None, decimate_error=None):
+
+    grid_spec = str(grid_step).replace(".", "")
+    bottom_spec = "with_bottom" if include_bottom else "without_bottom"
+    param_spec = f'{grid_spec}_{bottom_spec}'
+    metadata = {"grid_step": grid_step, "include_bottom": include_bottom}
+    if adaptive_tolerance is not None:
+        # Malha adaptativa: o passo final é grid_step só onde o erro de elevação passa da tolerância (em metros)
+        param_spec += f'_adaptive{str(adaptive_tolerance).replace(".", "")}'
+        metadata.update(adaptive_tolerance=adaptive_tolerance, adaptive_levels=ADAPTIVE_LEVELS)
+
+    # Tempo, CPU, memória e contagens de cada etapa vão para profile_<parâmetros>.json na pasta do mapa
+    location_folder = Path(f'data/maps/{location_name}')
+    profiler = PipelineProfiler(f'{location_name}_{param_spec}', profile=profile)
+    with profiler.stage('boundary') as stage:
+        polygon = load_boundary(osmid, location_name)
+        stage['boundary_vertices'] = len(polygon.exterior.coords)
+    with profiler.stage('catalog') as stage:
+        if estimator is None:
+            estimator = GeoElevationEstimator()
+        stage['tiles'] = len(estimator.catalog)
+
+    # Cada etapa é identificada pelo hash das suas entradas e parâmetros (incluindo a chave da etapa
+    # anterior). Uma etapa só é refeita quando a sua chave muda, ou sempre com force=True.
+    flat_path = mesh_path(location_folder / f'flat_surface_{param_spec}')
+    surface_path = mesh_path(location_folder / f'surface_{param_spec}')
+    stl_path = location_folder / f'surface_{param_spec}.stl'
+    fingerprints = tile_fingerprints(estimator.catalog, polygon.bounds)
+    if adaptive_tolerance is None:
+        flat_key = stage_key('flat_surface', polygon.wkb, grid_step, include_bottom)
+    else:
+        # A malha adaptativa depende das elevações amostradas durante o refinamento
+        flat_key = stage_key('flat_surface', polygon.wkb, grid_step, include_bottom, adaptive_tolerance,
+                             ADAPTIVE_LEVELS, lattice_extent(triangle_base=grid_step), estimator.method, estimator.k,
+                             use_mosaic, fingerprints)
+    surface_key = stage_key('surface', flat_key, estimator.method, estimator.k, use_mosaic, fingerprints)
+    stl_key = stage_key('stl', surface_key, decimate_faces, decimate_error)
+
+    if not force and is_fresh(stl_path, stl_key):
+        print("STL já está atualizado.")
+        return profiler.save(location_folder / f'profile_{param_spec}.json')
+
+    if not force and is_fresh(surface_path, surface_key):
+        with profiler.stage('load_surface'):
+            print("Carregando superfície...")
+            polygon3d = load_mesh(surface_path, mmap_mode=None)
+    else:
+        # As elevações guardadas valem só para estas folhas, este método e o uso ou não do mosaico;
+        # com force=True o cache da região começa vazio e é substituído ao salvar
+        estimator.cache = load_cache(cache_path(estimator.method, estimator.k, use_mosaic, fingerprints), reset=force)
+        if not force and is_fresh(flat_path, flat_key):
+            with profiler.stage('load_flat_surface'):
+                print("Carregando superfície plana...")
+                polygon3d = load_mesh(flat_path)
+        else:
+            plot_and_save_geometry(polygon, f'data/maps/{location_name}/poly_{param_spec}.png')
+
+            # Surface (surface_From_grid.py)
+            with profiler.stage('scaler'):
+                print("Inicializando scaler...")
+                scaler = PolyScaler()
+                scaler.fit(polygon)
+
+            # Loading Grid (generate_grid.py)
+            with profiler.stage('grid') as stage:
+                if adaptive_tolerance is not None:
+                    # Treliça grossa, refinada na etapa seguinte; a última linha de triângulos grossos pode
+                    # ficar abaixo do topo do domínio, então y_max ganha a margem de um triângulo grosso.
+                    # O refinamento corta a malha no retângulo da treliça uniforme de passo grid_step
+                    print("Gerando mesh grossa...")
+                    coarse_step = grid_step * 2 ** ADAPTIVE_LEVELS
+                    extent = scaler.inverse_transform(shapely.box(*lattice_extent(triangle_base=grid_step))).bounds
+                    grid = generate_triangle_lattice(y_max=20 + coarse_step,
+                                                     triangle_base=coarse_step,
+                                                     boundary=None if include_bottom else scaler.transform(polygon),
+                                                     buffer=coarse_step)
+                elif not include_bottom:
+                    # Sem a base, só os triângulos dentro da fronteira são usados: gera apenas esses,
+                    # com uma margem de um triângulo (o corte exato é feito em assign_z_coordinate)
+                    print("Gerando mesh dentro da fronteira...")
+                    grid = generate_triangle_lattice(triangle_base=grid_step, boundary=scaler.transform(polygon),
+                                                     buffer=grid_step)
+                else:
+                    grid = get_base_grid(grid_step)
+
+                print("Aplicando scaler no grid...")
+                grid = scaler.inverse_transform(grid)
+                stage.update(triangles=len(grid), vertices=len(grid.vertices))
+
+            with profiler.stage('assign_z') as stage:
+                print("Adicionando terceira coordenada...")
+                if adaptive_tolerance is not None:
+                    print("Refinando mesh...")
+                    queries = estimator.queries
+                    with estimator.use_mosaic(polygon.bounds) if use_mosaic else nullcontext():
+                        polygon3d = refine_surface(polygon, grid, include_bottom, estimator, adaptive_tolerance,
+                                                   extent=extent)
+                    stage['knn_queries'] = estimator.queries - queries
+                else:
+                    polygon3d = assign_z_coordinate(polygon, grid, include_bottom)
+                stage.update(triangles=len(polygon3d), vertices=len(polygon3d.vertices))
+                save_mesh(polygon3d, flat_path, metadata)
+                mark_fresh(flat_path, flat_key)
+                if export_json:
+                    save_multipolygon(polygon3d, location_folder / f'flat_surface_{param_spec}.json')
+
+        with profiler.stage('elevation') as stage:
+            print("Estimando elevação...")
+            misses, queries = estimator.misses, estimator.queries
+            # Com o mosaico, uma única janela contínua para toda a região, sem emendas entre folhas
+            with estimator.use_mosaic(polygon.bounds) if use_mosaic else nullcontext():
+                polygon3d = update_z_dimension(polygon3d, estimator)
+            stage.update(triangles=len(polygon3d), unique_vertices=len(polygon3d.vertices),
+                         tile_loads=estimator.misses - misses, knn_queries=estimator.queries - queries)
+            stage['cache_entries'] = len(estimator.cache)
+            estimator.cache.save()
+            tiles = [Path(estimator.catalog.paths[tile_id]).name
+                     for tile_id in estimator.catalog.tiles_for_bbox(polygon.bounds)]
+            save_mesh(polygon3d, surface_path, dict(metadata, method=estimator.method, tiles=tiles))
+            mark_fresh(surface_path, surface_key)
+            if export_json:
+                save_multipolygon(polygon3d, location_folder / f'surface_{param_spec}.json')
 
     # STL generation (stl_generation.py)
-    print("Normalizando polígono...")
-    norm_poly = normalize_multipolygon(polygon3d)
-    # Chama a função para converter para um arquivo STL
-    multipolygon_to_stl(norm_poly, filename=f'data/maps/{location_name}/surface_{param_spec}.stl')
+    with profiler.stage('normalize'):
+        print("Normalizando polígono...")
+        norm_poly = normalize_multipolygon(polygon3d, copy=False)
+    if decimate_faces is not None or decimate_error is not None:
+        with profiler.stage('decimate') as stage:
+            print("Simplificando malha...")
+            # normalize_multipolygon deixa z em km; o erro máximo é informado em metros
+            norm_poly, report = decimate(norm_poly, target_faces=decimate_faces,
+                                         max_error=None if decimate_error is None else decimate_error / 1000)
+            stage.update(triangles_in=report['faces_in'], triangles=report['faces_out'],
+                         reduction=report['reduction'], max_error_m=report['max_error'] * 1000,
+                         quadric_curve=[[p['faces'], p['quadric_error'] * 1000] for p in report['passes']],
+                         degenerate_faces=report['degenerate_faces'])
+            print(f"{report['faces_in']} -> {report['faces_out']} triângulos ({report['reduction']:.1%} a menos), "
+                  f"erro máximo {report['max_error'] * 1000:.1f} m")
+            if report['degenerate_faces']:
+                print(f"Aviso: {report['degenerate_faces']} triângulos com área nula ou invertida no STL")
+    with profiler.stage('stl') as stage:
+        # Chama a função para converter para um arquivo STL
+        stage['triangles'] = multipolygon_to_stl(norm_poly, filename=stl_path)
+        mark_fresh(stl_path, stl_key)
+    return profiler.save(location_folder / f'profile_{param_spec}.json')
 
 
 if __name__ == '__main__':
@@ -82,5 +236,14 @@ if __name__ == '__main__':
         # ('saopaulo_city', 298285, 0.1, False),
         # ('saupaulo_state', 298204, 0.1, False),
     ]
+    # --force refaz todas as etapas, ignorando o cache; --profile salva também o cProfile (profile_*.prof);
+    # --adaptive=<metros> gera a malha adaptativa com essa tolerância de elevação;
+    # --decimate=<metros> simplifica a malha antes do STL com esse erro vertical máximo
+    force = '--force' in sys.argv[1:]
+    profile = '--profile' in sys.argv[1:]
+    adaptive_tolerance = next((float(arg.split('=', 1)[1]) for arg in sys.argv[1:] if arg.startswith('--adaptive=')),
+                              None)
+    decimate_error = next((float(arg.split('=', 1)[1]) for arg in sys.argv[1:] if arg.startswith('--decimate=')), None)
     for location_name, osmid, grid_step, include_bottom in params:
-        generate_city_stl_with_base(osmid, location_name, grid_step, include_bottom)
+        generate_city_stl_with_base(osmid, location_name, grid_step, include_bottom, force=force, profile=profile,
+                                    adaptive_tolerance=adaptive_tolerance, decimate_error=decimate_error)
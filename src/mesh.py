@@ -0,0 +1,113 @@
+from shapely.geometry import MultiPolygon
+import numpy as np
+import shapely
+
+# Distância abaixo da qual dois vértices são considerados o mesmo (em graus, ~0,1 mm)
+WELD_TOLERANCE = 1e-9
+
+
+class TriangleMesh:
+    """
+    Indexed triangle mesh: a shared vertex array plus a face array of vertex indices.
+
+    Every pipeline stage accepts and returns this type. Each vertex is stored once,
+    however many triangles share it.
+
+    Args:
+        vertices (array-like): ``(n, 2)`` or ``(n, 3)`` float array of vertex coordinates.
+        faces (array-like): ``(m, 3)`` array with the vertex indices of each triangle.
+    """
+    def __init__(self, vertices, faces):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float64)
+        self.faces = np.ascontiguousarray(faces, dtype=np.int32).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.faces)
+
+    def __repr__(self):
+        return f"TriangleMesh({len(self.vertices)} vertices, {len(self.faces)} faces)"
+
+    @property
+    def bounds(self):
+        # Mesma convenção do shapely: (minx, miny, maxx, maxy)
+        min_x, min_y = self.vertices[:, :2].min(axis=0)
+        max_x, max_y = self.vertices[:, :2].max(axis=0)
+        return min_x, min_y, max_x, max_y
+
+    @property
+    def nbytes(self):
+        return self.vertices.nbytes + self.faces.nbytes
+
+    def copy(self):
+        return TriangleMesh(self.vertices.copy(), self.faces.copy())
+
+    def triangles(self):
+        """
+        Return the ``(m, 3, d)`` array with the coordinates of each triangle.
+        """
+        return self.vertices[self.faces]
+
+    def select_faces(self, mask):
+        """
+        Keep only some faces, dropping the vertices no longer used.
+
+        Args:
+            mask (np.ndarray): Boolean mask or index array over the faces.
+
+        Returns:
+            TriangleMesh: The reduced mesh.
+        """
+        return TriangleMesh(self.vertices, self.faces[mask]).remove_unused_vertices()
+
+    def remove_unused_vertices(self):
+        used, faces = np.unique(self.faces, return_inverse=True)
+        return TriangleMesh(self.vertices[used], faces.reshape(-1, 3))
+
+    def weld(self, tolerance=WELD_TOLERANCE):
+        """
+        Merge vertices that are closer than ``tolerance``, dropping the faces that collapse.
+
+        Coordinates are snapped to a grid with ``tolerance`` spacing and the vertices that
+        fall in the same cell become one, keeping the coordinates of the first of them. The
+        welded vertices come out sorted by y and then x, the row order of the elevation
+        tiles, so sampling them walks each tile in memory order.
+
+        Args:
+            tolerance (float): Snapping grid spacing.
+
+        Returns:
+            TriangleMesh: The welded mesh.
+        """
+        keys = np.rint(self.vertices / tolerance).astype(np.int64)
+        keys[:, [0, 1]] = keys[:, [1, 0]]
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        faces = inverse.reshape(-1)[self.faces]
+        collapsed = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 0] == faces[:, 2])
+        return TriangleMesh(self.vertices[first], faces[~collapsed])
+
+    @classmethod
+    def from_multipolygon(cls, multipolygon):
+        """
+        Build an indexed mesh from a MultiPolygon of triangles.
+
+        Args:
+            multipolygon (MultiPolygon): Triangles as shapely Polygons, 2D or 3D.
+
+        Returns:
+            TriangleMesh: The mesh, with identical coordinates merged into one vertex.
+        """
+        parts = shapely.get_parts(multipolygon)
+        rings = shapely.get_exterior_ring(parts)
+        if (shapely.get_num_coordinates(rings) != 4).any():
+            raise ValueError("O MultiPolygon deve conter apenas triângulos.")
+
+        dimension = 3 if shapely.has_z(parts).any() else 2
+        coords = shapely.get_coordinates(rings, include_z=dimension == 3).reshape(-1, 4, dimension)[:, :3]
+        vertices, inverse = np.unique(coords.reshape(-1, dimension), axis=0, return_inverse=True)
+        return cls(vertices, inverse.reshape(-1, 3))
+
+    def to_multipolygon(self):
+        """
+        Convert the mesh back to a MultiPolygon with one Polygon per triangle.
+        """
+        return MultiPolygon(list(shapely.polygons(self.triangles())))
@@ -0,0 +1,115 @@
+from pathlib import Path
+from src.tile_store import (ELEVATION_DTYPE, HEADER_SIZE, TILE_SUFFIX, convert_txt, open_tile, tile_is_current,
+                            tile_path, write_header)
+import numpy as np
+import hashlib
+import os
+
+MOSAIC_FOLDER = Path("data/mosaics")
+# Células extras em volta da região, para que os vizinhos da interpolação bicúbica existam nas bordas
+MARGIN_CELLS = 2
+
+
+def _open_tiles(catalog, tile_ids):
+    tiles = []
+    for tile_id in tile_ids:
+        filepath = catalog.paths[tile_id]
+        if not tile_is_current(filepath):
+            print(f"Convertendo arquivo {filepath}")
+            convert_txt(filepath)
+        tiles.append((filepath, *open_tile(tile_path(filepath))))
+    return tiles
+
+
+def _window(bounds, tiles):
+    # Alinha a janela à grade da primeira folha e a limita à área coberta pelas folhas
+    _, reference, _ = tiles[0]
+    dlat, dlon = reference["dlat"], reference["dlon"]
+    for filepath, header, _ in tiles:
+        if not (np.isclose(header["dlat"], dlat, rtol=1e-6) and np.isclose(header["dlon"], dlon, rtol=1e-6)):
+            raise ValueError(f"Arquivo {filepath} tem espaçamento diferente das demais folhas do mosaico.")
+
+    lat_min, lon_min, lat_max, lon_max = bounds
+    data_lat_min = min(header["lat0"] for _, header, _ in tiles)
+    data_lon_min = min(header["lon0"] for _, header, _ in tiles)
+    data_lat_max = max(header["lat0"] + (header["cols"] - 1) * dlat for _, header, _ in tiles)
+    data_lon_max = max(header["lon0"] + (header["rows"] - 1) * dlon for _, header, _ in tiles)
+
+    def index(value, origin, step):
+        return (value - origin) / step
+
+    c_min = max(np.floor(index(lat_min, reference["lat0"], dlat)) - MARGIN_CELLS,
+                np.rint(index(data_lat_min, reference["lat0"], dlat)))
+    c_max = min(np.ceil(index(lat_max, reference["lat0"], dlat)) + MARGIN_CELLS,
+                np.rint(index(data_lat_max, reference["lat0"], dlat)))
+    r_min = max(np.floor(index(lon_min, reference["lon0"], dlon)) - MARGIN_CELLS,
+                np.rint(index(data_lon_min, reference["lon0"], dlon)))
+    r_max = min(np.ceil(index(lon_max, reference["lon0"], dlon)) + MARGIN_CELLS,
+                np.rint(index(data_lon_max, reference["lon0"], dlon)))
+    return {
+        "rows": int(r_max - r_min) + 1, "cols": int(c_max - c_min) + 1,
+        "lat0": reference["lat0"] + c_min * dlat, "lon0": reference["lon0"] + r_min * dlon,
+        "dlat": dlat, "dlon": dlon,
+    }
+
+
+def _mosaic_path(folder, window, tiles):
+    key = hashlib.sha1()
+    key.update(repr(sorted(window.items())).encode())
+    for filepath, _, _ in tiles:
+        stat = tile_path(filepath).stat()
+        key.update(f"{Path(filepath).name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return Path(folder) / f"mosaic_{key.hexdigest()[:16]}{TILE_SUFFIX}"
+
+
+def build_mosaic(bounds, catalog, folder=MOSAIC_FOLDER):
+    """
+    Assemble the tiles that a region needs into one contiguous binary tile.
+
+    Only the part of each tile that falls inside the region window is read from
+    its memory map and copied, and the result is itself a ``.tile`` file, so it is
+    memory-mapped when used. Mosaics are kept in ``folder`` and reused while the
+    region and the source tiles do not change.
+
+    Args:
+        bounds (tuple): ``(lat_min, lon_min, lat_max, lon_max)``, as returned by ``polygon.bounds``.
+        catalog (TileCatalog): Catalog of the available tiles.
+        folder (str | Path): Folder where the mosaics are stored.
+
+    Returns:
+        Path: Path to the mosaic ``.tile`` file.
+    """
+    tile_ids = catalog.tiles_for_bbox(bounds)
+    if len(tile_ids) == 0:
+        raise ValueError(f"Nenhuma folha de elevação cobre a região {bounds}.")
+    tiles = _open_tiles(catalog, tile_ids)
+    window = _window(bounds, tiles)
+
+    out_path = _mosaic_path(folder, window, tiles)
+    if out_path.exists():
+        return out_path
+    os.makedirs(out_path.parent, exist_ok=True)
+
+    print(f"Montando mosaico com {len(tiles)} folhas em {out_path}")
+    tmp_path = out_path.with_name(out_path.name + ".part")
+    with open(tmp_path, "wb") as file:
+        write_header(file, window)
+    mosaic = np.memmap(tmp_path, dtype=ELEVATION_DTYPE, mode="r+", offset=HEADER_SIZE,
+                       shape=(window["rows"], window["cols"]))
+    mosaic[:] = np.nan
+
+    for _, header, grid in tiles:
+        # Posição da folha dentro da janela e o trecho que as duas têm em comum
+        col_offset = int(np.rint((header["lat0"] - window["lat0"]) / window["dlat"]))
+        row_offset = int(np.rint((header["lon0"] - window["lon0"]) / window["dlon"]))
+        c_start, c_end = max(col_offset, 0), min(col_offset + header["cols"], window["cols"])
+        r_start, r_end = max(row_offset, 0), min(row_offset + header["rows"], window["rows"])
+        if c_start >= c_end or r_start >= r_end:
+            continue
+        source = grid[r_start - row_offset:r_end - row_offset, c_start - col_offset:c_end - col_offset]
+        np.copyto(mosaic[r_start:r_end, c_start:c_end], source, where=~np.isnan(source))
+
+    mosaic.flush()
+    del mosaic
+    os.replace(tmp_path, out_path)
+    return out_path
@@ -0,0 +1,84 @@
+from src.main import load_boundary
+
+# Máximo de folhas distintas por grupo: limita a memória do estimador compartilhado pelo grupo.
+# Um mapa que sozinho precisa de mais folhas que isso (um estado inteiro, por exemplo) roda em um grupo só seu
+MAX_GROUP_TILES = 8
+
+
+def job_footprints(jobs, catalog):
+    """
+    Find the elevation tiles each job needs, from the bounds of its boundary polygon.
+
+    Args:
+        jobs (list): ``(osmid, location_name, grid_step, include_bottom)`` tuples.
+        catalog (TileCatalog): Catalog of the available tiles.
+
+    Returns:
+        list: Set of tile ids for each job.
+    """
+    footprints = []
+    for osmid, location_name, _, _ in jobs:
+        try:
+            footprints.append(set(catalog.tiles_for_bbox(load_boundary(osmid, location_name).bounds).tolist()))
+        except Exception as error:
+            # O erro volta a aparecer quando o job rodar e é reportado no resumo, sem afetar os demais
+            print(f"Não foi possível calcular as folhas do mapa {location_name}: {error}")
+            footprints.append(set())
+    return footprints
+
+
+def plan_jobs(jobs, footprints, max_group_tiles=MAX_GROUP_TILES):
+    """
+    Group jobs that share elevation tiles, so each group loads its tiles once.
+
+    Jobs are taken from the largest footprint to the smallest and each one joins the
+    group it shares the most tiles with, as long as the group stays within
+    ``max_group_tiles`` distinct tiles; otherwise it starts a new group. Inside a group
+    the jobs are ordered so that consecutive jobs share as many tiles as possible.
+
+    A job whose footprint alone exceeds ``max_group_tiles`` can never share a group:
+    it runs alone, and its estimator still keeps at most ``max_group_tiles`` tiles, so
+    its ``planned_loads`` is a lower bound. Raise the limit (together with the
+    estimator's ``max_bytes``) to group such jobs.
+
+    Args:
+        jobs (list): ``(osmid, location_name, grid_step, include_bottom)`` tuples.
+        footprints (list): Set of tile ids for each job, see ``job_footprints``.
+        max_group_tiles (int): Maximum number of distinct tiles in a group.
+
+    Returns:
+        tuple: The list of groups (each a list of jobs) and a dict with the number of tile
+            loads without planning (``naive_loads``), with planning (``planned_loads``), the
+            difference (``saved_loads``) and the number of jobs over the limit (``oversized_jobs``).
+    """
+    order = sorted(range(len(jobs)), key=lambda i: -len(footprints[i]))
+    groups, group_tiles = [], []
+    for i in order:
+        best, best_shared = None, 0
+        for g, tiles in enumerate(group_tiles):
+            shared = len(tiles & footprints[i])
+            if shared > best_shared and len(tiles | footprints[i]) <= max_group_tiles:
+                best, best_shared = g, shared
+        if best is None:
+            groups.append([i])
+            group_tiles.append(set(footprints[i]))
+        else:
+            groups[best].append(i)
+            group_tiles[best] |= footprints[i]
+
+    # Dentro do grupo, cada job é seguido pelo que mais compartilha folhas com ele
+    ordered_groups = []
+    for group in groups:
+        pending, ordered = group[1:], group[:1]
+        while pending:
+            last = footprints[ordered[-1]]
+            next_job = max(pending, key=lambda i: len(last & footprints[i]))
+            pending.remove(next_job)
+            ordered.append(next_job)
+        ordered_groups.append([jobs[i] for i in ordered])
+
+    naive_loads = sum(len(footprint) for footprint in footprints)
+    planned_loads = sum(len(tiles) for tiles in group_tiles)
+    stats = {'naive_loads': naive_loads, 'planned_loads': planned_loads, 'saved_loads': naive_loads - planned_loads,
+             'oversized_jobs': sum(len(footprint) > max_group_tiles for footprint in footprints)}
+    return ordered_groups, stats
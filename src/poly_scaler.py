@@ -1,5 +1,6 @@
 from shapely.geometry import Polygon, Point
 from shapely.affinity import scale, translate, affine_transform
+from src.mesh import TriangleMesh
 
 class PolyScaler:
     def __init__(self):
@@ -23,6 +24,11 @@ class PolyScaler:
     def transform(self, polygon: Polygon):
         if self.scale_x is None or self.scale_y is None:
             raise ValueError("Scaler has not been fitted yet.")
+        if isinstance(polygon, TriangleMesh):
+            vertices = polygon.vertices.copy()
+            vertices[:, 0] = vertices[:, 0] * self.scale_x + self.translation_x
+            vertices[:, 1] = vertices[:, 1] * self.scale_y + self.translation_y
+            return TriangleMesh(vertices, polygon.faces)
         scaled_polygon = scale(polygon, xfact=self.scale_x, yfact=self.scale_y, origin=(0, 0))
         translated_polygon = translate(scaled_polygon, xoff=self.translation_x, yoff=self.translation_y)
         return translated_polygon
@@ -30,6 +36,11 @@ class PolyScaler:
     def inverse_transform(self, polygon: Polygon):
         if self.scale_x is None or self.scale_y is None:
             raise ValueError("Scaler has not been fitted yet.")
+        if isinstance(polygon, TriangleMesh):
+            vertices = polygon.vertices.copy()
+            vertices[:, 0] = (vertices[:, 0] - self.translation_x) * (1 / self.scale_x)
+            vertices[:, 1] = (vertices[:, 1] - self.translation_y) * (1 / self.scale_y)
+            return TriangleMesh(vertices, polygon.faces)
         translated_polygon = translate(polygon, xoff=-self.translation_x, yoff=-self.translation_y)
         scaled_polygon = scale(translated_polygon, xfact=1/self.scale_x, yfact=1/self.scale_y, origin=(0, 0))
         return scaled_polygon
@@ -0,0 +1,128 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+import cProfile
+import json
+import os
+import resource
+import time
+
+
+def _status_mb(field):
+    # Campo de memória de /proc/self/status (Linux), em MB
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS of the process (VmHWM), so the next ``peak_rss_mb`` measures from now on.
+
+    Returns:
+        bool: False where it is not supported (no ``/proc``); the peak then stays the peak of the process.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    Return the peak RSS of the process since the last ``reset_peak_rss``, in MB.
+    """
+    peak = _status_mb("VmHWM")
+    if peak is None:
+        # Sem /proc, fica o pico do processo inteiro (ru_maxrss é em KB no Linux)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak
+
+
+class PipelineProfiler:
+    """
+    Record the wall time, CPU time, memory and item counts of each pipeline stage.
+
+    Each stage runs inside ``with profiler.stage(name) as stage:`` and can add its own
+    counts to the ``stage`` dict (e.g. triangles or tile loads). The peak RSS is reset
+    at the start of every stage on Linux, so it is the peak of that stage alone;
+    elsewhere it falls back to the peak of the whole process. The ``peak_rss_mb`` of
+    the report is the peak of the run, including the code between stages.
+
+    Args:
+        name (str): Name of the run, stored in the report.
+        profile (bool): Also collect a cProfile of the stages, saved next to the report.
+    """
+    def __init__(self, name, profile=False):
+        self.name = name
+        self.stages = []
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self._start = time.perf_counter()
+        self._profile = cProfile.Profile() if profile else None
+        # Pico fora das etapas (desde o início ou o fim da etapa anterior), lido antes de cada reset
+        reset_peak_rss()
+        self._outside_peak = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        record = {'stage': name}
+        self._outside_peak = max(self._outside_peak, peak_rss_mb())
+        per_stage_peak = reset_peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self._profile is not None:
+            self._profile.enable()
+        try:
+            yield record
+        finally:
+            if self._profile is not None:
+                self._profile.disable()
+            record.update({
+                'wall_s': time.perf_counter() - wall,
+                'cpu_s': time.process_time() - cpu,
+                'rss_mb': _status_mb("VmRSS"),
+                'peak_rss_mb': peak_rss_mb(),
+                'peak_is_per_stage': per_stage_peak,
+            })
+            self.stages.append(record)
+
+    def report(self):
+        """
+        Build the report of the run.
+
+        Returns:
+            dict: Run name, start time, total wall time and the record of each stage.
+        """
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'pid': os.getpid(),
+            'total_wall_s': time.perf_counter() - self._start,
+            'total_cpu_s': sum(stage['cpu_s'] for stage in self.stages),
+            'peak_rss_mb': max([self._outside_peak, peak_rss_mb()] + [stage['peak_rss_mb'] for stage in self.stages]),
+            'stages': self.stages,
+        }
+
+    def save(self, path):
+        """
+        Write the report as JSON and, when profiling, the cProfile stats next to it.
+
+        Args:
+            path (str | Path): Path of the JSON report. The stats go to the same path with ``.prof``.
+
+        Returns:
+            dict: The report.
+        """
+        path = Path(path)
+        report = self.report()
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=4)
+        if self._profile is not None:
+            self._profile.dump_stats(path.with_suffix('.prof'))
+        return report
@@ -0,0 +1,81 @@
+from pathlib import Path
+from src.tile_store import tile_path
+import hashlib
+
+KEY_SUFFIX = ".key"
+# Incrementar quando uma etapa do pipeline mudar a sua saída, para invalidar o cache antigo
+CACHE_VERSION = 1
+
+
+def stage_key(*parts):
+    """
+    Hash the inputs and parameters of a pipeline stage.
+
+    Args:
+        *parts: Values that determine the stage output: bytes, strings, numbers, or
+            lists/tuples of them (e.g. the key of the previous stage).
+
+    Returns:
+        str: Hex digest identifying the stage output.
+    """
+    key = hashlib.sha1()
+    for part in (CACHE_VERSION,) + parts:
+        data = part if isinstance(part, bytes) else repr(part).encode()
+        # O tamanho de cada parte evita que partes diferentes concatenadas gerem o mesmo hash
+        key.update(len(data).to_bytes(8, "little"))
+        key.update(data)
+    return key.hexdigest()
+
+
+def tile_fingerprints(catalog, bounds):
+    """
+    Identify the current version of the elevation tiles that cover a region.
+
+    Args:
+        catalog (TileCatalog): Catalog of the available tiles.
+        bounds (tuple): ``(lat_min, lon_min, lat_max, lon_max)``, as returned by ``polygon.bounds``.
+
+    Returns:
+        list: Name, size and modification time of the files behind each tile (the TXT
+            and its binary version, when they exist).
+    """
+    fingerprints = []
+    for tile_id in catalog.tiles_for_bbox(bounds):
+        filepath = Path(catalog.paths[tile_id])
+        # O TXT entra junto com a folha binária: um TXT editado muda a chave mesmo antes da nova conversão
+        for source in (filepath, tile_path(filepath)):
+            if source.exists():
+                stat = source.stat()
+                fingerprints.append((source.name, stat.st_size, stat.st_mtime_ns))
+    return fingerprints
+
+
+def _key_path(path):
+    path = Path(path)
+    return path.with_name(path.name + KEY_SUFFIX)
+
+
+def is_fresh(path, key):
+    """
+    Check whether a stage output exists and was produced from the inputs hashed in ``key``.
+
+    Args:
+        path (str | Path): Path of the stage output.
+        key (str): Key of the current inputs, see ``stage_key``.
+
+    Returns:
+        bool: True when the output can be reused.
+    """
+    key_path = _key_path(path)
+    return Path(path).exists() and key_path.exists() and key_path.read_text().strip() == key
+
+
+def mark_fresh(path, key):
+    """
+    Record the key of the inputs a stage output was produced from, next to it.
+
+    Args:
+        path (str | Path): Path of the stage output, already written.
+        key (str): Key of the inputs, see ``stage_key``.
+    """
+    _key_path(path).write_text(key)
@@ -0,0 +1,129 @@
+from pathlib import Path
+import numpy as np
+import os
+
+# Formato STL binário: cabeçalho livre de 80 bytes, número de triângulos (uint32) e
+# um registro de 50 bytes por triângulo (normal, três vértices e atributo).
+HEADER_SIZE = 80
+COUNT_DTYPE = np.dtype("<u4")
+RECORD_DTYPE = np.dtype([("normal", "<f4", (3,)), ("vectors", "<f4", (3, 3)), ("attr", "<u2")])
+CHUNK_SIZE = 1_000_000
+
+
+def face_normals(triangles):
+    """
+    Compute the unit normal of each triangle.
+
+    Args:
+        triangles (np.ndarray): ``(m, 3, 3)`` array with the vertices of each triangle.
+
+    Returns:
+        np.ndarray: ``(m, 3)`` array of unit normals, zero for degenerate triangles.
+    """
+    triangles = np.asarray(triangles, dtype=np.float64)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, lengths, out=normals, where=lengths > 0)
+    return normals
+
+
+class StlWriter:
+    """
+    Binary STL writer that receives the triangles in chunks.
+
+    The triangle count is only known at the end, so a placeholder is written after
+    the header and patched when the writer is closed. The file is written to a
+    ``.part`` path and renamed on success, so an interrupted export never leaves a
+    truncated STL behind.
+
+    Args:
+        filename (str | Path): Output STL path.
+        name (str): Text stored in the 80-byte header.
+    """
+    def __init__(self, filename, name="topography"):
+        self.filename = Path(filename)
+        self.count = 0
+        self._tmp_path = self.filename.with_name(self.filename.name + ".part")
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(name.encode()[:HEADER_SIZE].ljust(HEADER_SIZE, b" "))
+        self._file.write(np.zeros(1, dtype=COUNT_DTYPE).tobytes())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+    def write(self, triangles):
+        """
+        Append a chunk of triangles to the file.
+
+        Args:
+            triangles (np.ndarray): ``(m, 3, 3)`` array, or ``(m, 3, 2)`` for flat triangles (z = 0).
+        """
+        triangles = np.asarray(triangles, dtype=np.float64)
+        triangles = triangles.reshape(-1, 3, triangles.shape[-1])
+        if triangles.shape[-1] == 2:
+            triangles = np.concatenate([triangles, np.zeros(triangles.shape[:2] + (1,))], axis=2)
+
+        if self.count + len(triangles) > np.iinfo(COUNT_DTYPE).max:
+            raise ValueError(f"O formato STL binário não suporta mais de {np.iinfo(COUNT_DTYPE).max} triângulos.")
+
+        records = np.zeros(len(triangles), dtype=RECORD_DTYPE)
+        records["normal"] = face_normals(triangles)
+        records["vectors"] = triangles
+        self._file.write(records.tobytes())
+        self.count += len(triangles)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.seek(HEADER_SIZE)
+        self._file.write(np.array([self.count], dtype=COUNT_DTYPE).tobytes())
+        self._file.close()
+        os.replace(self._tmp_path, self.filename)
+
+
+def write_stl(vertices, faces, filename, chunk_size=CHUNK_SIZE):
+    """
+    Write an indexed triangle mesh as binary STL.
+
+    Only ``chunk_size`` triangles are expanded from the shared vertices at a time,
+    so memory stays bounded however large the mesh is.
+
+    Args:
+        vertices (np.ndarray): ``(n, 3)`` vertex coordinates.
+        faces (np.ndarray): ``(m, 3)`` vertex indices of each triangle.
+        filename (str | Path): Output STL path.
+        chunk_size (int): Number of triangles written at a time.
+
+    Returns:
+        int: Number of triangles written.
+    """
+    vertices = np.asarray(vertices)
+    faces = np.asarray(faces).reshape(-1, 3)
+    with StlWriter(filename) as writer:
+        for start in range(0, len(faces), chunk_size):
+            writer.write(vertices[faces[start:start + chunk_size]])
+    return writer.count
+
+
+def write_stl_stream(triangles, filename):
+    """
+    Write binary STL from an iterable of triangle chunks, e.g. a generator.
+
+    Args:
+        triangles (iterable): Arrays of shape ``(m, 3, 3)`` (or a single ``(3, 3)`` triangle).
+        filename (str | Path): Output STL path.
+
+    Returns:
+        int: Number of triangles written.
+    """
+    with StlWriter(filename) as writer:
+        for chunk in triangles:
+            writer.write(np.asarray(chunk))
+    return writer.count
@@ -1,30 +1,32 @@
 from src.elevatrion_estimator import GeoElevationEstimator
 from src.input_output import load_multipolygon, save_multipolygon, load_polygon
+from src.mesh import TriangleMesh
 from src.poly_scaler import PolyScaler
-from shapely.geometry import Polygon, MultiPolygon, Point
-from tqdm import tqdm
+from shapely.geometry import MultiPolygon
 from src.visualization import plot_multipolygon3d
 import numpy as np
+import shapely
 
 
 
 # Função para obter altitudes de uma lista de coordenadas
-def get_altitudes(points):
+def get_altitudes(points, estimator=None):
     """
     Retrieve altitudes for a list of coordinates from Model.
 
     Args:
         points (list): A list of point tuples in (latitude, longitude) format.
-        file_path (str): Path to the CSV file containing coordinates and elevations.
+        estimator (GeoElevationEstimator): Estimator to use. A new one is created if not given.
 
     Returns:
-        list: List of altitudes corresponding to the input points.
+        np.ndarray: Altitudes corresponding to the input points.
     """    
     # Inicializar e carregar o modelo
-    geo_estimator = GeoElevationEstimator()
+    geo_estimator = estimator if estimator is not None else GeoElevationEstimator()
     
-    # Calcular as elevações para cada ponto fornecido
-    altitudes = [geo_estimator.estimate_elevation(lat, lon) for lat, lon in tqdm(points, desc="Getting elevation")]
+    # Calcular as elevações de todos os pontos em uma única consulta
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    altitudes = geo_estimator.estimate_elevations(points[:, 0], points[:, 1])
     
     return altitudes
 
@@ -36,82 +38,90 @@ def assign_z_coordinate(polygon, multipolygon, include_bottom):
     z = 0, caso contrário (somente se include_bottom for True)
 
     :param polygon: Polygon - um polígono Shapely Polygon.
-    :param multipolygon: MultiPolygon - um multipolígono Shapely MultiPolygon.
+    :param multipolygon: TriangleMesh | MultiPolygon - a malha de triângulos.
     :param include_bottom: bool - inclui ou não os pontos externos com z = 0.
-    :return: MultiPolygon - um novo multipolígono com coordenadas Z.
+    :return: TriangleMesh | MultiPolygon - uma nova malha com coordenadas Z, do mesmo tipo da entrada.
     """
-    new_polygons = []
-
-    for poly in multipolygon.geoms:
-        new_exterior_coords = []
-        for x, y in poly.exterior.coords[:-1]:
-            if polygon.contains(Point(x, y)) or include_bottom:
-                new_exterior_coords.append((x, y, 1 if polygon.contains(Point(x, y)) else 0))
-
-        if len(new_exterior_coords) >= 3:  # Garantindo que temos um polígono válido
-            new_exterior_coords.append(new_exterior_coords[0])  # Fechando o anel
-
-            new_interiors = []
-            for interior in poly.interiors:
-                new_interior_coords = []
-                for x, y in interior.coords[:-1]:
-                    if polygon.contains(Point(x, y)) or include_bottom:
-                        new_interior_coords.append((x, y, 1 if polygon.contains(Point(x, y)) else 0))
-                if new_interior_coords:
-                    new_interior_coords.append(new_interior_coords[0])  # Fechando o anel
-                    new_interiors.append(new_interior_coords)
-
-            new_polygon = Polygon(new_exterior_coords, new_interiors)
-            new_polygons.append(new_polygon)
-
-    return MultiPolygon(new_polygons)
-
-def update_z_dimension(multipolygon):
-    # Filtra pontos com z=1 e remove duplicatas
-    unique_points = set()
-    for polygon in multipolygon.geoms:
-        for coord in np.asarray(polygon.exterior.coords):
-            if coord[2] == 1:
-                index = str(int(abs(coord[1]))) + str(int(abs(coord[0]) * 10))
-                unique_points.add((coord[0], coord[1], index))
-
-    unique_points = sorted(unique_points, key=lambda x: x[2])
-    unique_points = [(lat, lon) for lat, lon, _, in unique_points]
-
-    if unique_points:
-        # Obtém altitudes para os pontos filtrados
-        altitudes = get_altitudes(list(unique_points))
-        
-        # Cria um mapeamento ponto para altitude
-        altitudes_map = {point: altitude for point, altitude in zip(unique_points, altitudes)}
-        
+    if isinstance(multipolygon, TriangleMesh):
+        # Os vértices da malha já são únicos: basta um teste por vértice
+        vertices = multipolygon.vertices[:, :2]
+        shapely.prepare(polygon)
+        inside = shapely.contains_xy(polygon, vertices[:, 0], vertices[:, 1])
+        mesh = TriangleMesh(np.column_stack([vertices, inside.astype(float)]), multipolygon.faces)
+        if include_bottom:
+            return mesh
+        return mesh.select_faces(inside[mesh.faces].all(axis=1))
+
+    parts = shapely.get_parts(multipolygon)
+    rings, ring_polygons = shapely.get_rings(parts, return_index=True)
+    coords, coord_rings = shapely.get_coordinates(rings, return_index=True)
+
+    # Remove o ponto que fecha cada anel
+    ring_sizes = np.bincount(coord_rings, minlength=len(rings))
+    open_coords = np.ones(len(coords), dtype=bool)
+    open_coords[np.cumsum(ring_sizes) - 1] = False
+    coords, coord_rings = coords[open_coords], coord_rings[open_coords]
+
+    # Cada vértice único é testado uma única vez contra o polígono preparado
+    unique_coords, inverse = np.unique(coords, axis=0, return_inverse=True)
+    shapely.prepare(polygon)
+    inside = shapely.contains_xy(polygon, unique_coords[:, 0], unique_coords[:, 1])[inverse.ravel()]
+
+    keep = inside | include_bottom
+    coords3d = np.column_stack([coords, inside.astype(float)])[keep]
+    coord_rings = coord_rings[keep]
+
+    # Anéis com menos de 3 pontos são descartados; sem o exterior, o polígono inteiro é descartado
+    valid_rings = np.bincount(coord_rings, minlength=len(rings)) >= 3
+    is_exterior = np.ones(len(rings), dtype=bool)
+    is_exterior[1:] = ring_polygons[1:] != ring_polygons[:-1]
+    valid_polygons = np.zeros(len(parts), dtype=bool)
+    valid_polygons[ring_polygons[is_exterior & valid_rings]] = True
+    valid_rings &= valid_polygons[ring_polygons]
+
+    selected = valid_rings[coord_rings]
+    _, new_rings = np.unique(coord_rings[selected], return_inverse=True)
+    _, new_polygons = np.unique(ring_polygons[valid_rings], return_inverse=True)
+    new_rings = shapely.linearrings(coords3d[selected], indices=new_rings)
+    new_polygons = shapely.polygons(new_rings, indices=new_polygons)
+
+    return MultiPolygon(list(new_polygons))
+
+def update_z_dimension(multipolygon, estimator=None):
+    """
+    Substitui a marcação de dentro/fora da coordenada Z pela elevação do terreno:
+    z = elevação estimada, se o vértice estiver dentro do polígono (z = 1)
+    z = nível da base, 10% da amplitude abaixo do ponto mais baixo, caso contrário
+
+    :param multipolygon: TriangleMesh | MultiPolygon - malha retornada por assign_z_coordinate.
+    :param estimator: GeoElevationEstimator - estimador a ser usado (opcional).
+    :return: TriangleMesh | MultiPolygon - a malha com as elevações, do mesmo tipo da entrada.
+    """
+    if isinstance(multipolygon, MultiPolygon):
+        mesh = update_z_dimension(TriangleMesh.from_multipolygon(multipolygon), estimator)
+        return mesh.to_multipolygon()
+
+    # Une os vértices repetidos (ruído de ponto flutuante incluso) e os ordena na ordem das folhas,
+    # para que cada vértice seja estimado uma única vez
+    mesh = multipolygon.weld()
+    vertices = mesh.vertices
+    inside = vertices[:, 2] == 1
+
+    if inside.any():
+        # Obtém altitudes para os vértices internos
+        altitudes = get_altitudes(vertices[inside, :2], estimator)
+
         # Altitude mínima das altitudes obtidas
-        min_altitude = min(altitudes)
-        max_altitude = max(altitudes)
+        min_altitude = altitudes.min()
+        max_altitude = altitudes.max()
         range_altitude = max_altitude - min_altitude
         bottom_altitude = min_altitude - (0.1 * range_altitude)
+        vertices[inside, 2] = altitudes
     else:
-        min_altitude = 1  # Valor padrão se não houver altitudes
-
-    # Função para atualizar o Z
-    def update_z(coords, alt_map, min_alt):
-        new_coords = []
-        for x, y, z in coords:
-            if z == 1:
-                new_coords.append((x, y, alt_map.get((x, y), min_alt)))
-            else:
-                new_coords.append((x, y, bottom_altitude))
-        return new_coords
-
-    # Atualiza cada polígono no MultiPolygon
-    updated_polygons = []
-    for polygon in multipolygon.geoms:
-        exterior = update_z(polygon.exterior.coords, altitudes_map, min_altitude)
-        interiors = [update_z(interior.coords, altitudes_map, min_altitude) for interior in polygon.interiors]
-        updated_polygons.append(Polygon(exterior, interiors))
-
-    # Cria e retorna o MultiPolygon atualizado
-    return MultiPolygon(updated_polygons)
+        bottom_altitude = 0  # Valor padrão se não houver altitudes
+
+    vertices[~inside, 2] = bottom_altitude
+    return TriangleMesh(vertices, mesh.faces)
 
 if __name__ == "__main__":
 
@@ -0,0 +1,141 @@
+from pathlib import Path
+from src.tile_store import ELEVATION_FOLDER, TILE_SUFFIX, read_header, scan_txt, tile_is_current
+import numpy as np
+import json
+
+INDEX_NAME = "catalog.json"
+
+
+def tile_extent(header):
+    # Extensão real da folha: os nós da grade mais meia célula de cada lado
+    half_lat, half_lon = header["dlat"] / 2, header["dlon"] / 2
+    return [header["lat0"] - half_lat,
+            header["lat0"] + (header["cols"] - 1) * header["dlat"] + half_lat,
+            header["lon0"] - half_lon,
+            header["lon0"] + (header["rows"] - 1) * header["dlon"] + half_lon,
+            half_lat, half_lon]
+
+
+class TileCatalog:
+    """
+    Index of the elevation tiles available on disk and of their real extent.
+
+    Built once by scanning the elevation folder: binary tiles only need their
+    header, while TXT-only tiles are scanned once and remembered in a small
+    ``catalog.json`` index next to them.
+
+    Args:
+        paths (list): Path of each tile (the ``*cor_rec.txt`` path, even when only the ``.tile`` exists).
+        extents (array-like): ``(n, 6)`` array with lat_min, lat_max, lon_min, lon_max of each
+            tile, plus the half cell size in lat and lon included in that extent.
+    """
+    def __init__(self, paths, extents):
+        self.paths = list(paths)
+        extents = np.asarray(extents, dtype=float).reshape(-1, 6)
+        self.extents = extents[:, :4]
+        self.margins = extents[:, 4:]
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def scan(cls, base_path=ELEVATION_FOLDER):
+        """
+        Build the catalog from the tiles in a folder.
+
+        Args:
+            base_path (str | Path): Folder with the ``*cor_rec.txt`` and/or ``*cor_rec.tile`` files.
+
+        Returns:
+            TileCatalog: The catalog, sorted by tile name.
+        """
+        base_path = Path(base_path)
+        index_path = base_path / INDEX_NAME
+        index = json.loads(index_path.read_text()) if index_path.exists() else {}
+        updated = False
+
+        stems = sorted({path.stem for path in base_path.glob(f"*cor_rec{TILE_SUFFIX}")} |
+                       {path.stem for path in base_path.glob("*cor_rec.txt")})
+        paths, extents = [], []
+        for stem in stems:
+            txt_path = base_path / f"{stem}.txt"
+            binary_path = base_path / f"{stem}{TILE_SUFFIX}"
+            if tile_is_current(txt_path):
+                extent = tile_extent(read_header(binary_path))
+            else:
+                stat = txt_path.stat()
+                entry = index.get(txt_path.name)
+                if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+                    print(f"Indexando arquivo {txt_path}")
+                    entry = {"size": stat.st_size, "mtime": stat.st_mtime,
+                             "extent": tile_extent(scan_txt(txt_path))}
+                    index[txt_path.name] = entry
+                    updated = True
+                extent = entry["extent"]
+            paths.append(txt_path)
+            extents.append(extent)
+
+        if updated:
+            index_path.write_text(json.dumps(index, indent=4))
+        return cls(paths, extents)
+
+    def with_tiles(self, paths, headers):
+        """
+        Return a new catalog with extra tiles placed ahead of the existing ones.
+
+        Args:
+            paths (list): Paths of the extra tiles.
+            headers (list): Binary tile header of each extra tile.
+
+        Returns:
+            TileCatalog: The extended catalog. The extra tiles win where they overlap the others.
+        """
+        extents = [tile_extent(header) for header in headers]
+        return TileCatalog(list(paths) + self.paths,
+                           np.vstack([np.reshape(extents, (-1, 6)), np.hstack([self.extents, self.margins])]))
+
+    def tiles_for_points(self, lats, lons):
+        """
+        Find the tile that covers each point.
+
+        Args:
+            lats (array-like): Latitudes of the points.
+            lons (array-like): Longitudes of the points.
+
+        Returns:
+            np.ndarray: Index of the covering tile for each point, or -1 when no tile covers it.
+                Tiles whose sample grid surrounds the point are preferred over tiles that only
+                reach it through their border half cell; after that, the first one in the catalog wins.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        tile_ids = np.full(len(lats), -1, dtype=np.int64)
+        if len(lats) == 0:
+            return tile_ids
+
+        candidates = self.tiles_for_bbox((lats.min(), lons.min(), lats.max(), lons.max()))
+        for margin_scale in (1, 0):
+            for tile_id in candidates:
+                pending = np.flatnonzero(tile_ids == -1)
+                if len(pending) == 0:
+                    return tile_ids
+                margin_lat, margin_lon = self.margins[tile_id] * margin_scale
+                lat_min, lat_max, lon_min, lon_max = self.extents[tile_id]
+                inside = ((lats[pending] >= lat_min + margin_lat) & (lats[pending] <= lat_max - margin_lat) &
+                          (lons[pending] >= lon_min + margin_lon) & (lons[pending] <= lon_max - margin_lon))
+                tile_ids[pending[inside]] = tile_id
+        return tile_ids
+
+    def tiles_for_bbox(self, bounds):
+        """
+        Find the tiles that intersect a bounding box.
+
+        Args:
+            bounds (tuple): ``(lat_min, lon_min, lat_max, lon_max)``, as returned by ``polygon.bounds``.
+
+        Returns:
+            np.ndarray: Indices of the intersecting tiles.
+        """
+        lat_min, lon_min, lat_max, lon_max = bounds
+        return np.flatnonzero((self.extents[:, 0] <= lat_max) & (self.extents[:, 1] >= lat_min) &
+                              (self.extents[:, 2] <= lon_max) & (self.extents[:, 3] >= lon_min))
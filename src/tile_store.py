@@ -0,0 +1,260 @@
+from pathlib import Path
+from tqdm import tqdm
+import numpy as np
+import pandas as pd
+import os
+import zipfile
+
+ELEVATION_FOLDER = Path("data/elevation")
+TILE_SUFFIX = ".tile"
+
+# Cabeçalho fixo de 64 bytes seguido da matriz de elevações (float32, NaN = sem dado).
+# A linha r e a coluna c da matriz correspondem a lon = lon0 + r * dlon e lat = lat0 + c * dlat,
+# seguindo a ordem das colunas dos arquivos TXT do INPE (lat, lon, elevation).
+MAGIC = b"TOPO"
+VERSION = 1
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"), ("version", "<u4"), ("rows", "<u4"), ("cols", "<u4"),
+    ("lat0", "<f8"), ("lon0", "<f8"), ("dlat", "<f8"), ("dlon", "<f8"),
+])
+ELEVATION_DTYPE = np.dtype("<f4")
+CHUNK_SIZE = 1_000_000
+
+
+def tile_path(txt_path):
+    """
+    Return the binary tile path that corresponds to an INPE TXT file.
+
+    Args:
+        txt_path (str | Path): Path to the ``*cor_rec.txt`` file.
+
+    Returns:
+        Path: Path to the ``*cor_rec.tile`` file, in the same folder.
+    """
+    return Path(txt_path).with_suffix(TILE_SUFFIX)
+
+
+def tile_is_current(txt_path, source=None):
+    """
+    Check whether the binary tile of an INPE TXT file exists and is up to date.
+
+    A tile is stale when its source was modified after it was converted, e.g. a TXT
+    or ZIP downloaded again or edited by hand.
+
+    Args:
+        txt_path (str | Path): Path to the ``*cor_rec.txt`` file (it may not exist).
+        source (str | Path): File the tile was converted from. Defaults to ``txt_path``.
+
+    Returns:
+        bool: True when the ``.tile`` exists and is not older than its source.
+    """
+    tile = tile_path(txt_path)
+    source = Path(source if source is not None else txt_path)
+    if not tile.exists():
+        return False
+    return not source.exists() or source.stat().st_mtime_ns <= tile.stat().st_mtime_ns
+
+
+def _open(source):
+    # Arquivo no disco ou membro de um ZIP (zipfile.Path), descompactado aos poucos, sem extrair
+    return source.open("rb") if isinstance(source, zipfile.Path) else open(source, "rb")
+
+
+def _read_chunks(source, chunksize=CHUNK_SIZE):
+    with _open(source) as file:
+        yield from pd.read_csv(file, sep=r"\s+", names=["lat", "lon", "elevation"], dtype=np.float64,
+                               chunksize=chunksize)
+
+
+def _min_step(values):
+    steps = np.diff(np.unique(values))
+    steps = steps[steps > 1e-9]
+    return steps.min() if len(steps) else np.inf
+
+
+def _axis(lower, upper, step):
+    # Ajusta o espaçamento para que os extremos caiam exatamente sobre a grade
+    if not np.isfinite(step):
+        return lower, 1.0, 1
+    size = int(round((upper - lower) / step)) + 1
+    return lower, (upper - lower) / (size - 1), size
+
+
+def scan_txt(filepath, chunksize=CHUNK_SIZE):
+    """
+    Work out the grid of an INPE TXT tile without keeping the file in memory.
+
+    Args:
+        filepath (str | Path | zipfile.Path): Path to the ``*cor_rec.txt`` file, or to the file inside a ZIP.
+        chunksize (int): Number of lines parsed at a time.
+
+    Returns:
+        dict: rows, cols, lat0, lon0, dlat and dlon of the tile grid.
+    """
+    bounds = np.array([np.inf, -np.inf, np.inf, -np.inf])
+    lat_step, lon_step = np.inf, np.inf
+    for chunk in _read_chunks(filepath, chunksize):
+        lats, lons = chunk["lat"].values, chunk["lon"].values
+        bounds = [min(bounds[0], lats.min()), max(bounds[1], lats.max()),
+                  min(bounds[2], lons.min()), max(bounds[3], lons.max())]
+        lat_step = min(lat_step, _min_step(lats))
+        lon_step = min(lon_step, _min_step(lons))
+
+    lat0, dlat, cols = _axis(bounds[0], bounds[1], lat_step)
+    lon0, dlon, rows = _axis(bounds[2], bounds[3], lon_step)
+    return {"rows": rows, "cols": cols, "lat0": lat0, "lon0": lon0, "dlat": dlat, "dlon": dlon}
+
+
+def write_header(file, header):
+    record = np.zeros(1, dtype=HEADER_DTYPE)
+    record["magic"] = MAGIC
+    record["version"] = VERSION
+    for key in ("rows", "cols", "lat0", "lon0", "dlat", "dlon"):
+        record[key] = header[key]
+    file.write(record.tobytes().ljust(HEADER_SIZE, b"\0"))
+
+
+def read_header(path):
+    """
+    Read the header of a binary tile.
+
+    Args:
+        path (str | Path): Path to the ``.tile`` file.
+
+    Returns:
+        dict: rows, cols, lat0, lon0, dlat and dlon of the tile grid.
+    """
+    with open(path, "rb") as file:
+        record = np.frombuffer(file.read(HEADER_DTYPE.itemsize), dtype=HEADER_DTYPE)[0]
+    if record["magic"] != MAGIC or record["version"] != VERSION:
+        raise ValueError(f"Arquivo {path} não é uma folha binária válida.")
+    return {
+        "rows": int(record["rows"]), "cols": int(record["cols"]),
+        "lat0": float(record["lat0"]), "lon0": float(record["lon0"]),
+        "dlat": float(record["dlat"]), "dlon": float(record["dlon"]),
+    }
+
+
+def open_tile(path):
+    """
+    Open a binary tile as a read-only memory map.
+
+    Args:
+        path (str | Path): Path to the ``.tile`` file.
+
+    Returns:
+        tuple: The header dict and the ``(rows, cols)`` elevation matrix.
+    """
+    header = read_header(path)
+    grid = np.memmap(path, dtype=ELEVATION_DTYPE, mode="r", offset=HEADER_SIZE,
+                     shape=(header["rows"], header["cols"]))
+    return header, grid
+
+
+def _fill(filepath, header, grid, chunksize):
+    # Segunda passada: posiciona cada elevação na sua célula da grade
+    grid[:] = np.nan
+    for chunk in _read_chunks(filepath, chunksize):
+        cols = np.rint((chunk["lat"].values - header["lat0"]) / header["dlat"]).astype(np.int64)
+        rows = np.rint((chunk["lon"].values - header["lon0"]) / header["dlon"]).astype(np.int64)
+        grid[rows, cols] = chunk["elevation"].values
+
+
+def read_txt(filepath, chunksize=CHUNK_SIZE):
+    """
+    Read an INPE TXT tile straight into an in-memory elevation matrix.
+
+    Args:
+        filepath (str | Path): Path to the ``*cor_rec.txt`` file.
+        chunksize (int): Number of lines parsed at a time.
+
+    Returns:
+        tuple: The header dict and the ``(rows, cols)`` elevation matrix.
+    """
+    header = scan_txt(filepath, chunksize)
+    grid = np.empty((header["rows"], header["cols"]), dtype=ELEVATION_DTYPE)
+    _fill(filepath, header, grid, chunksize)
+    return header, grid
+
+
+def convert_txt(filepath, out_path=None, chunksize=CHUNK_SIZE):
+    """
+    Convert an INPE TXT tile into the binary tile format.
+
+    The TXT is read twice in chunks (extent first, values second), so memory
+    stays bounded regardless of the tile size.
+
+    Args:
+        filepath (str | Path | zipfile.Path): Path to the ``*cor_rec.txt`` file, or to the file inside a ZIP.
+        out_path (str | Path): Output path. Defaults to ``tile_path(filepath)``, next to the TXT.
+        chunksize (int): Number of lines parsed at a time.
+
+    Returns:
+        Path: Path to the written ``.tile`` file.
+    """
+    out_path = Path(out_path) if out_path is not None else tile_path(filepath)
+    header = scan_txt(filepath, chunksize)
+
+    # Escreve em um arquivo temporário e renomeia no final, para nunca deixar uma folha pela metade
+    tmp_path = out_path.with_name(out_path.name + ".part")
+    with open(tmp_path, "wb") as file:
+        write_header(file, header)
+    grid = np.memmap(tmp_path, dtype=ELEVATION_DTYPE, mode="r+", offset=HEADER_SIZE,
+                     shape=(header["rows"], header["cols"]))
+    _fill(filepath, header, grid, chunksize)
+    grid.flush()
+    del grid
+
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def convert_zip(zip_path, folder=ELEVATION_FOLDER, overwrite=False, chunksize=CHUNK_SIZE):
+    """
+    Convert the TXT tiles inside a Topodata ZIP straight into binary tiles.
+
+    Each TXT is decompressed in chunks while it is read, so no plain-text copy is
+    ever written to disk and memory stays bounded.
+
+    Args:
+        zip_path (str | Path): Path to the ZIP file.
+        folder (str | Path): Folder where the ``.tile`` files are written.
+        overwrite (bool): Convert again tiles that already have an up-to-date binary version.
+            Tiles older than the ZIP are always converted again.
+        chunksize (int): Number of lines parsed at a time.
+
+    Returns:
+        list: Paths to the ``.tile`` files of the ZIP.
+    """
+    os.makedirs(folder, exist_ok=True)
+    out_paths = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for name in archive.namelist():
+            if not name.endswith("cor_rec.txt"):
+                continue
+            out_path = tile_path(Path(folder) / Path(name).name)
+            if overwrite or not tile_is_current(out_path.with_suffix(".txt"), zip_path):
+                convert_txt(zipfile.Path(archive, name), out_path, chunksize)
+            out_paths.append(out_path)
+    return out_paths
+
+
+def convert_all(folder=ELEVATION_FOLDER, overwrite=False):
+    """
+    Convert every ``*cor_rec.txt`` tile in a folder to the binary tile format.
+
+    Tiles whose TXT was modified after the conversion are converted again.
+
+    Args:
+        folder (str | Path): Folder with the INPE TXT tiles.
+        overwrite (bool): Convert again tiles that already have an up-to-date binary version.
+    """
+    file_list = sorted(Path(folder).glob("*cor_rec.txt"))
+    for file in tqdm(file_list, desc="Converting files"):
+        if overwrite or not tile_is_current(file):
+            convert_txt(file)
+
+
+if __name__ == "__main__":
+    convert_all()
@@ -2,9 +2,11 @@ from src.input_output import load_wkt, save_polygon
 from scipy.spatial import Delaunay
 from shapely.geometry import Polygon, MultiPolygon, Point
 from shapely.wkt import loads
-from stl import mesh
 from src.utils import remove_srid
+from src.mesh import TriangleMesh
+from src.stl_writer import CHUNK_SIZE, write_stl, write_stl_stream
 import numpy as np
+import shapely
 
 def wkt_to_polygon(wkt_str):
     # Primeiro, carregamos a string WKT usando a função loads da Shapely
@@ -23,96 +25,70 @@ def wkt_to_polygon(wkt_str):
         raise ValueError("A string WKT fornecida não representa um Polygon ou MultiPolygon.")
     
 
+def _fan_triangles(multipolygon, chunk_size=CHUNK_SIZE):
+    # Triangula cada polígono em leque a partir do primeiro vértice do exterior,
+    # gerando os triângulos em blocos de polígonos
+    polygons = shapely.get_parts(multipolygon)
+    for start in range(0, len(polygons), chunk_size):
+        rings = shapely.get_exterior_ring(polygons[start:start + chunk_size])
+        coords = shapely.get_coordinates(rings, include_z=True)
+        coords[np.isnan(coords[:, 2]), 2] = 0
+
+        counts = shapely.get_num_coordinates(rings)
+        n_triangles = np.maximum(counts - 3, 0)
+        first = np.repeat(np.cumsum(counts) - counts, n_triangles)
+        i = np.arange(n_triangles.sum()) - np.repeat(np.cumsum(n_triangles) - n_triangles, n_triangles) + 1
+        yield coords[np.stack([first, first + i, first + i + 1], axis=1)]
+
+
 def multipolygon_to_stl(multipolygon, filename):
     """
-    Transforma um objeto MultiPolygon do Shapely em um arquivo STL.
+    Transforma um objeto MultiPolygon do Shapely em um arquivo STL binário.
 
-    :param multipolygon: Um objeto Shapely MultiPolygon contendo triângulos.
+    Os triângulos são escritos em blocos, sem montar a malha inteira em memória.
+
+    :param multipolygon: Um objeto Shapely MultiPolygon contendo triângulos, ou uma TriangleMesh.
     :param filename: Nome do arquivo STL de saída.
+    :return: Número de triângulos escritos.
     """
-    assert isinstance(multipolygon, MultiPolygon), "O objeto deve ser um MultiPolygon do Shapely."
+    if isinstance(multipolygon, TriangleMesh):
+        return write_stl(multipolygon.vertices, multipolygon.faces, filename)
 
-    # Criar uma lista para armazenar os vértices para o Mesh
-    vertices = []
+    assert isinstance(multipolygon, MultiPolygon), "O objeto deve ser um MultiPolygon do Shapely."
+    return write_stl_stream(_fan_triangles(multipolygon), filename)
 
-    for polygon in multipolygon.geoms:  # Iterar através dos Polygons dentro do MultiPolygon
-        if isinstance(polygon, Polygon):
-            exterior_coords = polygon.exterior.coords
-            for i in range(1, len(exterior_coords) - 2):
-                # Cada triângulo é formado pelo primeiro ponto do exterior e dois pontos consecutivos
-                tri = [exterior_coords[0], exterior_coords[i], exterior_coords[i+1]]
-                vertices.extend(tri)
 
-    # Criando o modelo STL
-    stl_mesh = mesh.Mesh(np.zeros(len(vertices) // 3, dtype=mesh.Mesh.dtype))
+def normalize_multipolygon(multipolygon, scale=(1, 1, 1), vertical_exaggeration=1.0, copy=True):
+    """
+    Translada a superfície para que os mínimos fiquem em (0, 0, 0) e aplica a escala.
 
-    for i in range(len(vertices) // 3):
-        stl_mesh.vectors[i] = np.array(vertices[3*i:3*i+3])
+    A elevação é convertida de metros para km (z / 1000), multiplicada pelo exagero vertical
+    e, por fim, todos os eixos são multiplicados por ``scale``. Os mínimos saem de uma única
+    redução sobre o array de coordenadas e a translação e a escala são feitas no próprio array.
 
-    # Escrevendo o arquivo STL
-    stl_mesh.save(filename)
+    :param multipolygon: Uma TriangleMesh, ou um MultiPolygon 3D (os buracos são preservados).
+    :param scale: Escala adicional em x, y e z.
+    :param vertical_exaggeration: Fator extra aplicado somente ao eixo z.
+    :param copy: Se False, os vértices de uma TriangleMesh são normalizados no lugar.
+    :return: A superfície normalizada, do mesmo tipo da entrada.
+    """
+    factors = np.asarray(scale, dtype=np.float64) * [1.0, 1.0, vertical_exaggeration / 1000.0]
 
+    def normalize(coords):
+        coords -= coords.min(axis=0)
+        coords *= factors
+        return coords
 
-def normalize_multipolygon(multipolygon, scale=(1, 1, 1)):
-    # Calcular os mínimos de todas as coordenadas para a translação
-    all_coords = [point for polygon in multipolygon.geoms for point in polygon.exterior.coords]
-    min_x = min(x for x, y, z in all_coords)
-    min_y = min(y for x, y, z in all_coords)
-    min_z = min(z for x, y, z in all_coords)
-    
-    def normalize_point(x, y, z):
-        # Reduzindo a escala do eixo z em 1000x
-        new_z = z / 1000.0
-        # Aplicando translação para que os pontos mínimos fiquem em 0,0,0
-        new_x = x - min_x
-        new_y = y - min_y
-        new_z = new_z - min_z
-        # Aplicando a escala adicional fornecida
-        new_x *= scale[0]
-        new_y *= scale[1]
-        new_z *= scale[2]
-        return (new_x, new_y, new_z)
-    
-    # Criar e retornar um novo MultiPolygon normalizado
-    normalized_polygons = []
-    for polygon in multipolygon.geoms:
-        new_exterior = [normalize_point(x, y, z) for x, y, z in polygon.exterior.coords]
-        # Polygon espera que o primeiro e o último ponto sejam iguais; ao criar o new_polygon, eles serão verificados
-        new_polygon = Polygon(new_exterior)
-        normalized_polygons.append(new_polygon)
-    
-    # Unimos todos os polígonos normalizados em um MultiPolygon
-    return MultiPolygon(normalized_polygons)
+    if isinstance(multipolygon, TriangleMesh):
+        vertices = multipolygon.vertices.copy() if copy else multipolygon.vertices
+        return TriangleMesh(normalize(vertices), multipolygon.faces)
 
+    # O shapely entrega todas as coordenadas (exteriores e buracos) em um único array
+    return shapely.transform(multipolygon, normalize, include_z=True)
 
-from shapely.geometry import MultiPolygon, Polygon
 
 def normalize_multipolygon_3d(multipolygon):
-    # Calcular os limites dos polígonos
-    min_x = min(coord[0] for p in multipolygon.geoms for coord in p.exterior.coords)
-    min_y = min(coord[1] for p in multipolygon.geoms for coord in p.exterior.coords)
-    min_z = min(coord[2] for p in multipolygon.geoms for coord in p.exterior.coords)
-
-    # O fator de escala para o eixo z é fixo: 1/1000
-    scale_z = 1 / 1000
-
-    # Normalizar cada polígono
-    normalized_polygons = []
-    for polygon in multipolygon.geoms:
-        # Normalizar as coordenadas considerando a diminuição do eixo 'z'
-        norm_coords = [(
-            coord[0] - min_x,  # Translação para a origem no eixo x
-            coord[1] - min_y,  # Translação para a origem no eixo y
-            (coord[2] * scale_z) - min_z  # Redução da escala no eixo z e translação para a origem
-        ) for coord in polygon.exterior.coords]
-        
-        # Criar um novo polígono com as coordenadas normalizadas
-        norm_polygon = Polygon(norm_coords)
-        normalized_polygons.append(norm_polygon)
-    
-    # Criar um novo multipolygon com os polígonos normalizados
-    normalized_multipolygon = MultiPolygon(normalized_polygons)
-    return normalized_multipolygon
+    return normalize_multipolygon(multipolygon)
 
 
 def create_grid_polygon(polygon, step=0.1):